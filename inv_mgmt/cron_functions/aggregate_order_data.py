@@ -1,14 +1,43 @@
 import frappe
 from frappe import _
-from frappe.utils import getdate, nowdate, add_days, today
+from frappe.utils import getdate, nowdate, now, add_days, today, cint
 import json
 from typing import List, Dict, Any, Optional
 from collections import defaultdict
+from functools import lru_cache
+from inv_mgmt.custom_inventory_management.doctype.sf_inventory_data_import_error_logs.sf_inventory_data_import_error_logs import (
+    buffer_error_log, flush_error_logs, insert_error_logs, start_error_log_buffer
+)
 
 
 # Debug flag - set to True to enable debug print statements
+# Per-order / per-item debug_print calls are guarded with `if DEBUG:` at the call site
+# so their f-strings are not built when debugging is off
 DEBUG = True
 
+# Savepoint used to isolate each sales order within a batch transaction
+SALES_ORDER_SAVEPOINT = "aggregated_sales_order"
+
+# Fields shared by every aggregated Sales Order (see _create_transfer_sales_order).
+# Orders are inserted directly as submitted: insert() then runs the submit hooks itself,
+# so each order is validated and written once instead of once for insert and again for submit
+SALES_ORDER_TEMPLATE = {
+    "doctype": "Sales Order",
+    "docstatus": 1
+}
+
+# Maximum number of names per batched processing status UPDATE
+PROCESSING_UPDATE_CHUNK_SIZE = 5000
+
+# Branches aggregated per background job and the timeout of each job (see enqueue_daily_order_aggregation).
+# Shards run one per long queue worker on that worker's own database connection, so the
+# number of concurrent connections is bounded by the worker count and needs no extra pool.
+# One branch per job by default; the daily_order_aggregation_branch_shard_size site config overrides it
+BRANCH_SHARD_SIZE = 1
+# Same budget step 5 had inside the comprehensive cron job: a shard killed after some plant -> DC
+# groups committed would never mark their orders as processed, and a rerun would duplicate them
+AGGREGATION_SHARD_TIMEOUT = 1500
+
 def debug_print(message: str):
     """Print debug messages only when DEBUG flag is True"""
     if DEBUG:
@@ -42,74 +71,89 @@ def log_error(error_category: str, error_description: str, processing_stage: str
         additional_detail: Additional details as JSON
     """
     try:
-        # Check if we're currently in a transaction
-        in_transaction = hasattr(frappe.db, 'transaction_writes') and frappe.db.transaction_writes > 0
-        
-        if in_transaction:
-            # If we're in a transaction, defer error logging to avoid implicit commits
-            # Store error details in frappe.local for later logging
-            if not hasattr(frappe.local, 'deferred_error_logs'):
-                frappe.local.deferred_error_logs = []
-            
-            frappe.local.deferred_error_logs.append({
-                "doctype": "SF Inventory Data Import Error Logs",
-                "error_category": error_category,
-                "error_description": error_description,
-                "processing_stage": processing_stage,
-                "entity_type": entity_type,
-                "external_id": external_id,
-                "reference_doctype": reference_doctype,
-                "internal_reference": internal_reference,
-                "error_severity": error_severity,
+        log_errors_bulk([{
+            "error_category": error_category,
+            "error_description": error_description,
+            "processing_stage": processing_stage,
+            "entity_type": entity_type,
+            "external_id": external_id,
+            "reference_doctype": reference_doctype,
+            "internal_reference": internal_reference,
+            "error_severity": error_severity,
+            "additional_detail": additional_detail
+        }], deduplicate=False)
+    except Exception as e:
+        error_print(f"Failed to log error: {str(e)}")
+
+
+def log_errors_bulk(errors: List[Dict], deduplicate: bool = True):
+    """
+    Log several errors to SF Inventory Data Import Error Logs with one multi-row INSERT and a
+    single commit (see insert_error_logs)
+    Inside a transaction they are buffered until flush_deferred_error_logs, to avoid implicit commits
+    
+    Args:
+        errors: List of dicts with the keyword arguments of log_error
+        deduplicate: Log errors repeating the same (error_category, external_id) pair once
+    """
+    if not errors:
+        return
+    
+    try:
+        if deduplicate:
+            unique_errors = {}
+            for error in errors:
+                unique_errors.setdefault((error.get("error_category"), error.get("external_id")), error)
+            errors = unique_errors.values()
+        
+        error_logs = []
+        for error in errors:
+            additional_detail = error.get("additional_detail")
+            error_logs.append({
+                "error_category": error.get("error_category"),
+                "error_description": error.get("error_description"),
+                "processing_stage": error.get("processing_stage"),
+                "entity_type": error.get("entity_type"),
+                "external_id": error.get("external_id"),
+                "reference_doctype": error.get("reference_doctype"),
+                "internal_reference": error.get("internal_reference"),
+                "error_severity": error.get("error_severity", "Medium"),
                 "additional_detail": json.dumps(additional_detail) if additional_detail else None,
                 "error_date": nowdate(),
                 "source_system": "Scheduled Jobs"
             })
-            debug_print(f"Error deferred for later logging (within transaction): {error_description}")
+        
+        # Check if we're currently in a transaction
+        in_transaction = hasattr(frappe.db, 'transaction_writes') and frappe.db.transaction_writes > 0
+        
+        if in_transaction:
+            # Defer to flush_deferred_error_logs (see sf_inventory_data_import_error_logs)
+            start_error_log_buffer()
+            for error_log in error_logs:
+                buffer_error_log(error_log)
+            if DEBUG:
+                debug_print(f"{len(error_logs)} errors deferred for later logging (within transaction)")
         else:
-            # If not in a transaction, log immediately
-            error_log = frappe.get_doc({
-                "doctype": "SF Inventory Data Import Error Logs",
-                "error_category": error_category,
-                "error_description": error_description,
-                "processing_stage": processing_stage,
-                "entity_type": entity_type,
-                "external_id": external_id,
-                "reference_doctype": reference_doctype,
-                "internal_reference": internal_reference,
-                "error_severity": error_severity,
-                "additional_detail": json.dumps(additional_detail) if additional_detail else None,
-                "error_date": nowdate(),
-                "source_system": "Scheduled Jobs"
-            })
-            error_log.insert(ignore_permissions=True)
+            # All rows are written by one batched INSERT, then committed once
+            insert_error_logs(error_logs)
             frappe.db.commit()
-            debug_print(f"Error logged immediately: {error_description}")
+            debug_print(f"{len(error_logs)} errors logged immediately")
             
     except Exception as e:
-        error_print(f"Failed to log error: {str(e)}")
+        error_print(f"Failed to log errors: {str(e)}")
 
 
 def flush_deferred_error_logs():
     """
     Flush any deferred error logs that were stored during transactions
     """
-    if hasattr(frappe.local, 'deferred_error_logs') and frappe.local.deferred_error_logs:
-        debug_print(f"Flushing {len(frappe.local.deferred_error_logs)} deferred error logs")
-        
-        try:
-            for error_data in frappe.local.deferred_error_logs:
-                error_log = frappe.get_doc(error_data)
-                error_log.insert(ignore_permissions=True)
-            
+    try:
+        count = flush_error_logs()
+        if count:
             frappe.db.commit()
-            debug_print(f"Successfully flushed {len(frappe.local.deferred_error_logs)} error logs")
-            
-            # Clear the deferred logs
-            frappe.local.deferred_error_logs = []
-            
-        except Exception as e:
-            error_print(f"Failed to flush deferred error logs: {str(e)}")
+            debug_print(f"Successfully flushed {count} error logs")
+    except Exception as e:
+        error_print(f"Failed to flush deferred error logs: {str(e)}")
 
 
 def aggregate_orders_and_create_sales_orders(branches: List[str], order_date: str) -> Dict[str, Any]:
@@ -128,6 +172,13 @@ def aggregate_orders_and_create_sales_orders(branches: List[str], order_date: st
     # Remove transaction management from this level - let sub-functions handle their own transactions
     # frappe.db.begin()  # REMOVED - this was causing the implicit commit error
     
+    # Start every run with empty customer shipping address, combo breakdown, internal customer
+    # and item existence caches
+    frappe.local.customer_shipping_address_cache = {}
+    frappe.local.combo_unit_breakdown_cache = {}
+    frappe.local.internal_customer_cache = {}
+    frappe.local.existing_item_cache = {}
+    
     try:
         info_print(f"Starting order aggregation for branches: {branches}, date: {order_date}")
         
@@ -206,10 +257,16 @@ def aggregate_orders_and_create_sales_orders(branches: List[str], order_date: st
             processed_d2c_orders, processed_b2b_orders, order_date
         )
         
-        total_created_orders = len(created_sales_orders)
+        total_created_orders = created_sales_orders["total"]
         info_print(f"Created {total_created_orders} sales orders (D2C: {len(created_sales_orders['d2c_orders'])}, B2B: {len(created_sales_orders['b2b_orders'])})")
         
-        # Step 6: Mark successfully processed orders and items
+        # Step 6: Mark successfully processed orders and items. Orders of DC groups whose sales
+        # orders failed are left unmarked, so the next run retries them
+        failed_order_names = created_sales_orders.get("failed_orders", [])
+        if failed_order_names:
+            info_print(f"{len(failed_order_names)} orders were not marked as processed because their sales orders failed")
+        exclude_failed_orders(d2c_processing_results, failed_order_names)
+        exclude_failed_orders(b2b_processing_results, failed_order_names)
         mark_orders_and_items_as_processed(d2c_processing_results, b2b_processing_results)
         
         # Remove commit - let mark_orders_and_items_as_processed handle its own transaction
@@ -284,7 +341,8 @@ def build_warehouse_hierarchy(branches: List[str]) -> Dict[str, Dict]:
         
         debug_print(f"Found {len(all_warehouses)} total warehouses for branches {branches}")
         for warehouse in all_warehouses:
-            debug_print(f"  - {warehouse.name} ({warehouse.warehouse_name}) - Branch: {warehouse.custom_branch}, Category: {warehouse.custom_warehouse_category}")
+            if DEBUG:
+                debug_print(f"  - {warehouse.name} ({warehouse.warehouse_name}) - Branch: {warehouse.custom_branch}, Category: {warehouse.custom_warehouse_category}")
         
         # Get all plants for the specified branches
         plants = frappe.db.sql("""
@@ -587,13 +645,15 @@ def group_orders_by_hierarchy(orders: List[Dict], hierarchy: Dict, order_type: s
         darkstore_facility = order.get("darkstore")
         
         if not plant_facility:
-            debug_print(f"Skipping order {order.get('name')} - missing plant facility")
+            if DEBUG:
+                debug_print(f"Skipping order {order.get('name')} - missing plant facility")
             continue
             
         # Find the corresponding plant warehouse
         plant_info = facility_to_warehouse.get(plant_facility)
         if not plant_info:
-            debug_print(f"Skipping order {order.get('name')} - plant facility mapping not found")
+            if DEBUG:
+                debug_print(f"Skipping order {order.get('name')} - plant facility mapping not found")
             continue
             
         plant_warehouse = plant_info["warehouse"]
@@ -601,12 +661,14 @@ def group_orders_by_hierarchy(orders: List[Dict], hierarchy: Dict, order_type: s
         if order_type == "D2C":
             # D2C orders must have a darkstore/distribution center
             if not darkstore_facility:
-                debug_print(f"Skipping D2C order {order.get('name')} - missing darkstore facility")
+                if DEBUG:
+                    debug_print(f"Skipping D2C order {order.get('name')} - missing darkstore facility")
                 continue
                 
             darkstore_info = facility_to_warehouse.get(darkstore_facility)
             if not darkstore_info:
-                debug_print(f"Skipping D2C order {order.get('name')} - darkstore facility mapping not found")
+                if DEBUG:
+                    debug_print(f"Skipping D2C order {order.get('name')} - darkstore facility mapping not found")
                 continue
                 
             if darkstore_info["type"] == "darkstore":
@@ -630,7 +692,8 @@ def group_orders_by_hierarchy(orders: List[Dict], hierarchy: Dict, order_type: s
             else:
                 darkstore_info = facility_to_warehouse.get(darkstore_facility)
                 if not darkstore_info:
-                    debug_print(f"Skipping B2B order {order.get('name')} - darkstore facility mapping not found")
+                    if DEBUG:
+                        debug_print(f"Skipping B2B order {order.get('name')} - darkstore facility mapping not found")
                     continue
                     
                 if darkstore_info["type"] == "darkstore":
@@ -682,17 +745,31 @@ def process_order_items(grouped_orders: Dict, order_type: str) -> tuple[Dict, Di
                     
                     debug_print(f"Processing {len(orders)} {order_type} orders for darkstore {darkstore}")
                     
+                    # Fetch the unprocessed items of all orders in this group in one query
+                    items_by_order = defaultdict(list)
+                    if orders:
+                        group_order_items = frappe.db.sql("""
+                            SELECT parent, item_id, item_name, quantity, sf_product_master, name as item_row_name
+                            FROM `tabSF Order Item`
+                            WHERE parent IN %(order_names)s
+                            AND (is_item_processed IS NULL OR is_item_processed = 0)
+                        """, {"order_names": [order.name for order in orders]}, as_dict=True)
+                        
+                        for group_order_item in group_order_items:
+                            items_by_order[group_order_item.parent].append(group_order_item)
+                        
+                        # Check the ERPNext Items linked by the group's products in one query
+                        preload_existing_items(list({
+                            group_order_item.sf_product_master for group_order_item in group_order_items
+                            if group_order_item.sf_product_master
+                        }))
+                    
                     # Process each order's items
                     for order in orders:
                         order_items_processed = {}
                         order_processing_details = {}
                         
-                        order_items = frappe.db.sql("""
-                            SELECT item_id, item_name, quantity, sf_product_master, name as item_row_name
-                            FROM `tabSF Order Item`
-                            WHERE parent = %(order_name)s
-                            AND (is_item_processed IS NULL OR is_item_processed = 0)
-                        """, {"order_name": order.name}, as_dict=True)
+                        order_items = items_by_order.get(order.name, [])
                         
                         # Process each item individually
                         for order_item in order_items:
@@ -725,7 +802,7 @@ def process_order_items(grouped_orders: Dict, order_type: str) -> tuple[Dict, Di
                                     }
                                     continue
                                     
-                                sf_product = frappe.get_doc("SF Product Master", order_item.sf_product_master)
+                                sf_product = frappe.get_cached_doc("SF Product Master", order_item.sf_product_master)
                                 
                                 if sf_product.is_combo:
                                     # Validate and expand combo items
@@ -767,7 +844,7 @@ def process_order_items(grouped_orders: Dict, order_type: str) -> tuple[Dict, Di
                                         continue
                                         
                                     # Check if the linked item exists in ERPNext
-                                    if not frappe.db.exists("Item", sf_product.item_link):
+                                    if not item_exists(sf_product.item_link):
                                         error_print(f"Order {order.name}: ERPNext Item {sf_product.item_link} does not exist")
                                         log_error(
                                             error_category="Missing Reference",
@@ -848,7 +925,8 @@ def process_order_items(grouped_orders: Dict, order_type: str) -> tuple[Dict, Di
                                 "successful_items": len(successful_items),
                                 "total_items": total_items
                             })
-                            debug_print(f"Order {order.name} processed successfully - {len(successful_items)}/{total_items} items")
+                            if DEBUG:
+                                debug_print(f"Order {order.name} processed successfully - {len(successful_items)}/{total_items} items")
                         else:
                             # No items were successful
                             processing_results["discarded_orders"].append({
@@ -878,6 +956,14 @@ def process_order_items(grouped_orders: Dict, order_type: str) -> tuple[Dict, Di
                     # Remove empty darkstore entries
                     if not processed[plant][dc][darkstore]["orders"]:
                         del processed[plant][dc][darkstore]
+                    else:
+                        # Keep only positive quantities so the merge and sales order steps
+                        # never carry (or re-filter) zero quantity items
+                        processed[plant][dc][darkstore]["items"] = {
+                            item_code: quantity
+                            for item_code, quantity in processed[plant][dc][darkstore]["items"].items()
+                            if quantity > 0
+                        }
                 
                 # Remove empty DC entries
                 if not processed[plant][dc]:
@@ -906,7 +992,8 @@ def process_order_items(grouped_orders: Dict, order_type: str) -> tuple[Dict, Di
         raise
 
 
-def validate_and_expand_combo_items(sf_product: object, order_quantity: float, order_name: str) -> Optional[Dict[str, float]]:
+def validate_and_expand_combo_items(sf_product: object, order_quantity: float, order_name: str,
+                                    product_map: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, float]]:
     """
     Validate and expand combo items to individual items
     
@@ -914,6 +1001,8 @@ def validate_and_expand_combo_items(sf_product: object, order_quantity: float, o
         sf_product: SF Product Master document
         order_quantity: Quantity ordered
         order_name: Order name for error logging
+        product_map: Optional preloaded SF Product Master records keyed by name
+                     (see load_sf_product_map); avoids a get_doc per combo item
     
     Returns:
         Dict of item_code -> total_quantity, or None if validation fails
@@ -944,7 +1033,12 @@ def validate_and_expand_combo_items(sf_product: object, order_quantity: float, o
         
         for combo_item in sf_product.combo_items:
             try:
-                combo_sf_product = frappe.get_doc("SF Product Master", combo_item.sf_product_id)
+                if product_map is not None:
+                    combo_sf_product = product_map.get(combo_item.sf_product_id)
+                    if not combo_sf_product:
+                        raise frappe.DoesNotExistError
+                else:
+                    combo_sf_product = frappe.get_cached_doc("SF Product Master", combo_item.sf_product_id)
             except frappe.DoesNotExistError:
                 error_print(f"Order {order_name}: Combo item SF Product {combo_item.sf_product_id} does not exist")
                 log_error(
@@ -991,7 +1085,7 @@ def validate_and_expand_combo_items(sf_product: object, order_quantity: float, o
                 return None
                 
             # Check if the linked item exists in ERPNext
-            if not frappe.db.exists("Item", combo_sf_product.item_link):
+            if not item_exists(combo_sf_product.item_link):
                 error_print(f"Order {order_name}: ERPNext Item {combo_sf_product.item_link} does not exist")
                 log_error(
                     error_category="Missing Reference",
@@ -1043,6 +1137,185 @@ def validate_and_expand_combo_items(sf_product: object, order_quantity: float, o
         return None
 
 
+def preload_existing_items(sf_product_names: List[str]) -> None:
+    """
+    Check in one query which ERPNext Items linked by the given SF Products (and by
+    their combo items) exist, and add the result to the run's item cache used by item_exists
+    
+    Args:
+        sf_product_names: SF Product Master names
+    """
+    item_cache = getattr(frappe.local, 'existing_item_cache', None)
+    if item_cache is None or not sf_product_names:
+        return
+    
+    item_links = frappe.db.sql("""
+        SELECT product.item_link, item.name
+        FROM `tabSF Product Master` product
+        LEFT JOIN `tabItem` item ON item.name = product.item_link
+        WHERE IFNULL(product.item_link, '') != ''
+        AND (
+            product.name IN %(sf_products)s
+            OR product.name IN (
+                SELECT sf_product_id
+                FROM `tabSF Product Combo Details`
+                WHERE parenttype = 'SF Product Master'
+                AND parent IN %(sf_products)s
+            )
+        )
+    """, {"sf_products": sf_product_names})
+    
+    for item_link, item_name in item_links:
+        item_cache[item_link] = bool(item_name)
+
+
+def item_exists(item_code: str) -> bool:
+    """
+    Check if an ERPNext Item exists.
+    Results are cached in frappe.local for the current aggregation run
+    (see aggregate_orders_and_create_sales_orders and preload_existing_items).
+    """
+    item_cache = getattr(frappe.local, 'existing_item_cache', None)
+    if item_cache is not None and item_code in item_cache:
+        return item_cache[item_code]
+    
+    exists = bool(frappe.db.exists("Item", item_code))
+    
+    if item_cache is not None:
+        item_cache[item_code] = exists
+    
+    return exists
+
+
+def load_sf_product_map(sf_product_names: List[str]) -> Dict[str, Any]:
+    """
+    Load the SF Product Master fields needed for item aggregation in bulk.
+    Combo products get their combo_items attached, and the SF Product Master
+    records referenced by those combo items are loaded as well.
+    
+    Args:
+        sf_product_names: SF Product Master names to load
+    
+    Returns:
+        Dict of SF Product Master name -> record (name, sf_product_id, is_combo, item_link, combo_items)
+    """
+    product_map = {}
+    names_to_load = set(sf_product_names)
+    requested_names = set()
+    
+    # Usually two passes: the requested products, then the combo components not already loaded
+    while names_to_load:
+        requested_names.update(names_to_load)
+        products = frappe.db.sql("""
+            SELECT name, sf_product_id, is_combo, item_link
+            FROM `tabSF Product Master`
+            WHERE name IN %(names)s
+        """, {"names": list(names_to_load)}, as_dict=True)
+        
+        for product in products:
+            product.combo_items = []
+            product_map[product.name] = product
+        
+        combo_names = [product.name for product in products if product.is_combo]
+        if not combo_names:
+            break
+        
+        combo_rows = frappe.db.sql("""
+            SELECT parent, sf_product_id, quantity
+            FROM `tabSF Product Combo Details`
+            WHERE parent IN %(parents)s
+            AND parenttype = 'SF Product Master'
+            ORDER BY parent, idx
+        """, {"parents": combo_names}, as_dict=True)
+        
+        for combo_row in combo_rows:
+            product_map[combo_row.parent].combo_items.append(combo_row)
+        
+        names_to_load = {
+            combo_row.sf_product_id for combo_row in combo_rows
+            if combo_row.sf_product_id and combo_row.sf_product_id not in requested_names
+        }
+    
+    debug_print(f"Loaded {len(product_map)} SF Product Master records")
+    return product_map
+
+
+def get_combo_unit_breakdown(sf_product: object, order_name: str,
+                             product_map: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, float]]:
+    """
+    Get the item_code -> quantity breakdown of one unit of a combo product.
+    Results (including failed validations) are cached in frappe.local for the current
+    aggregation run, so each combo is validated and expanded once instead of once per order.
+    
+    Args:
+        sf_product: SF Product Master document or preloaded record
+        order_name: Order name for error logging on the first validation
+        product_map: Optional preloaded SF Product Master records keyed by name
+    
+    Returns:
+        Dict of item_code -> quantity per combo unit, or None if validation fails
+    """
+    breakdown_cache = getattr(frappe.local, 'combo_unit_breakdown_cache', None)
+    if breakdown_cache is not None and sf_product.name in breakdown_cache:
+        return breakdown_cache[sf_product.name]
+    
+    unit_breakdown = validate_and_expand_combo_items(sf_product, 1, order_name, product_map)
+    
+    if breakdown_cache is not None:
+        breakdown_cache[sf_product.name] = unit_breakdown
+    
+    return unit_breakdown
+
+
+def _aggregate_items_for_orders(customer_orders: List[Dict]) -> Dict[str, float]:
+    """
+    Aggregate the unprocessed items of the given orders into ERPNext item quantities,
+    expanding combo products. Quantities are summed per SF Product Master in the
+    database, so the Python loop (and combo expansion) runs once per distinct product
+    instead of once per order item.
+    
+    Args:
+        customer_orders: SF Order Master records
+    
+    Returns:
+        Dict of item_code -> total_quantity
+    """
+    aggregated_items = defaultdict(float)
+    
+    if not customer_orders:
+        return aggregated_items
+    
+    # One row per product; MIN(parent) is only kept as a reference for error logging
+    product_totals = frappe.db.sql("""
+        SELECT sf_product_master, SUM(quantity) AS quantity, MIN(parent) AS parent
+        FROM `tabSF Order Item`
+        WHERE parent IN %(order_names)s
+        AND (is_item_processed IS NULL OR is_item_processed = 0)
+        AND IFNULL(sf_product_master, '') != ''
+        GROUP BY sf_product_master
+    """, {"order_names": [order.name for order in customer_orders]}, as_dict=True)
+    
+    if not product_totals:
+        return aggregated_items
+    
+    product_map = load_sf_product_map([product_total.sf_product_master for product_total in product_totals])
+    
+    for product_total in product_totals:
+        sf_product = product_map.get(product_total.sf_product_master)
+        if not sf_product or not product_total.quantity:
+            continue
+        
+        if sf_product.is_combo:
+            unit_breakdown = get_combo_unit_breakdown(sf_product, product_total.parent, product_map)
+            if unit_breakdown:
+                for item_code, unit_qty in unit_breakdown.items():
+                    aggregated_items[item_code] += unit_qty * product_total.quantity
+        elif sf_product.item_link:
+            aggregated_items[sf_product.item_link] += product_total.quantity
+    
+    return aggregated_items
+
+
 def update_error_log_categories():
     """
     Update the SF Inventory Data Import Error Logs with new categories for order aggregation
@@ -1112,11 +1385,11 @@ def create_combined_sales_orders(d2c_orders: Dict, b2b_orders: Dict, order_date:
     """
     info_print("Creating combined sales orders for D2C and B2B orders")
     
-    # Remove transaction management - let individual functions handle their own transactions
-    # frappe.db.begin()  # REMOVED - this was causing the implicit commit error
+    # Transactions are opened per plant -> DC group below
     
     try:
         created_orders = []
+        failed_order_names = []
         
         # Get default company and internal customer
         default_company = frappe.defaults.get_defaults().get("company")
@@ -1127,93 +1400,75 @@ def create_combined_sales_orders(d2c_orders: Dict, b2b_orders: Dict, order_date:
         # Combine D2C and B2B orders by plant and DC for internal transfers
         combined_orders = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: {"items": defaultdict(float), "orders": []})))
         
-        # Add D2C items and orders
-        for plant, plant_data in d2c_orders.items():
-            for dc, dc_data in plant_data.items():
-                for darkstore, darkstore_data in dc_data.items():
-                    # Add items
-                    for item_code, quantity in darkstore_data.get("items", {}).items():
-                        combined_orders[plant][dc][darkstore]["items"][item_code] += quantity
-                    # Add orders
-                    combined_orders[plant][dc][darkstore]["orders"].extend(darkstore_data.get("orders", []))
-        
-        # Add B2B items and orders
-        for plant, plant_data in b2b_orders.items():
-            for dc, dc_data in plant_data.items():
-                for darkstore, darkstore_data in dc_data.items():
-                    # Add items
-                    for item_code, quantity in darkstore_data.get("items", {}).items():
-                        combined_orders[plant][dc][darkstore]["items"][item_code] += quantity
-                    # Add orders
-                    combined_orders[plant][dc][darkstore]["orders"].extend(darkstore_data.get("orders", []))
+        # Add D2C and B2B items and orders
+        for processed_orders in (d2c_orders, b2b_orders):
+            for plant, plant_data in processed_orders.items():
+                for dc, dc_data in plant_data.items():
+                    for darkstore, darkstore_data in dc_data.items():
+                        # Add items
+                        for item_code, quantity in darkstore_data.get("items", {}).items():
+                            combined_orders[plant][dc][darkstore]["items"][item_code] += quantity
+                        # Add orders
+                        combined_orders[plant][dc][darkstore]["orders"].extend(darkstore_data.get("orders", []))
+        
+        # Preload the shipping addresses of all destination DCs and darkstores
+        facility_address_map = load_facility_shipping_addresses([
+            warehouse
+            for plant_data in combined_orders.values()
+            for dc, dc_data in plant_data.items()
+            for warehouse in [dc, *dc_data.keys()]
+        ])
         
         # Now create sales orders
+        # All sales orders of one plant -> DC network are committed together; each order
+        # runs in its own savepoint (see _create_transfer_sales_order) so a failing order
+        # does not discard the rest of the group.
+        # Groups are created one after another on purpose: every Sales Order insert locks
+        # the naming series row until commit and the orders of one DC update the same
+        # source warehouse Bin rows, so parallel workers would only queue on (or deadlock
+        # over) those locks while each needing its own site connection.
+        # The branch shard jobs of enqueue_daily_order_aggregation do run at the same time, but
+        # their groups share only the series row (different branches have different source
+        # warehouses), so a group of one shard waits for the running group of another to commit;
+        # the sales order phase stays effectively serial across shards
         for plant, plant_data in combined_orders.items():
             for dc, dc_data in plant_data.items():
+                # Don't open a transaction for a group that can't produce any sales order
+                if not any(
+                    darkstore_data["items"] or any(order.get("order_type") == "B2B" for order in darkstore_data["orders"])
+                    for darkstore_data in dc_data.values()
+                ):
+                    debug_print(f"No items or B2B orders for DC {dc}, skipping")
+                    continue
                 
-                # Create ONE distribution center order (from plant to DC) with ALL items
-                dc_order = create_sales_order_for_distribution_center(
-                    plant, dc, dc_data, order_date, internal_customer, default_company, True, "Internal"
-                )
-                if dc_order:
-                    created_orders.append(dc_order)
-                    info_print(f"Created combined DC order: {dc_order['sales_order']}")
-                
-                # Process each darkstore
-                for darkstore, darkstore_data in dc_data.items():
-                    if darkstore == "DC_DIRECT":
-                        # Direct DC orders - create customer-specific orders for B2B only
-                        b2b_orders_list = [order for order in darkstore_data["orders"] if order.get("order_type") == "B2B"]
-                        if b2b_orders_list:
-                            customer_groups = group_b2b_orders_by_customer(b2b_orders_list)
-                            for customer, customer_orders in customer_groups.items():
-                                if customer != internal_customer:
-                                    dc_direct_order = create_sales_order_for_dc_direct_with_orders(
-                                        dc, customer_orders, order_date, customer, default_company, False
-                                    )
-                                    if dc_direct_order:
-                                        created_orders.append(dc_direct_order)
-                                        info_print(f"Created DC direct order: {dc_direct_order['sales_order']}")
-                                        
-                    elif darkstore == "CLIENT":
-                        # Direct plant to client orders - create customer-specific orders for B2B only
-                        b2b_orders_list = [order for order in darkstore_data["orders"] if order.get("order_type") == "B2B"]
-                        if b2b_orders_list:
-                            customer_groups = group_b2b_orders_by_customer(b2b_orders_list)
-                            for customer, customer_orders in customer_groups.items():
-                                if customer != internal_customer:
-                                    plant_direct_order = create_sales_order_for_plant_direct_with_orders(
-                                        plant, customer_orders, order_date, customer, default_company, False
-                                    )
-                                    if plant_direct_order:
-                                        created_orders.append(plant_direct_order)
-                                        info_print(f"Created plant direct order: {plant_direct_order['sales_order']}")
-                    else:
-                        # Regular darkstore orders
-                        # Create ONE internal transfer (DC to Darkstore) with ALL items
-                        if darkstore_data.get("items"):
-                            darkstore_order = create_sales_order_for_darkstore(
-                                dc, darkstore, darkstore_data, order_date, internal_customer, default_company, True, "Internal"
-                            )
-                            if darkstore_order:
-                                created_orders.append(darkstore_order)
-                                info_print(f"Created combined darkstore order: {darkstore_order['sales_order']}")
-                        
-                        # Create customer-specific orders from darkstore to client (B2B only)
-                        b2b_orders_list = [order for order in darkstore_data["orders"] if order.get("order_type") == "B2B"]
-                        if b2b_orders_list:
-                            customer_groups = group_b2b_orders_by_customer(b2b_orders_list)
-                            for customer, customer_orders in customer_groups.items():
-                                if customer != internal_customer:
-                                    darkstore_to_client_order = create_sales_order_for_darkstore_to_client_with_orders(
-                                        darkstore, customer_orders, order_date, customer, default_company, False
-                                    )
-                                    if darkstore_to_client_order:
-                                        created_orders.append(darkstore_to_client_order)
-                                        info_print(f"Created darkstore to client order: {darkstore_to_client_order['sales_order']}")
-        
-        # Remove commit - let individual functions handle their own transactions
-        # frappe.db.commit()  # REMOVED
+                frappe.db.begin()
+                try:
+                    created_orders.extend(create_sales_orders_for_dc_group(
+                        plant, dc, dc_data, order_date, internal_customer, default_company,
+                        facility_address_map
+                    ))
+                    frappe.db.commit()
+                except Exception as e:
+                    # Only this group is rolled back; its orders are reported as failed so they
+                    # are not marked as processed and the next run picks them up again
+                    frappe.db.rollback()
+                    group_order_names = get_dc_group_order_names(dc_data)
+                    failed_order_names.extend(group_order_names)
+                    error_print(f"Error creating sales orders for plant {plant} -> DC {dc}: {str(e)}")
+                    log_error(
+                        error_category="Order Processing",
+                        error_description=f"Failed to create sales orders for plant {plant} -> DC {dc}: {str(e)}",
+                        processing_stage="Order Aggregation",
+                        entity_type="Sales Order",
+                        error_severity="Critical",
+                        additional_detail={
+                            "plant": plant,
+                            "distribution_center": dc,
+                            "order_date": order_date,
+                            "order_names": group_order_names,
+                            "error": str(e)
+                        }
+                    )
         
         # Separate orders by type for reporting
         d2c_orders_created = [order for order in created_orders if order.get("order_type") in ["D2C", "Internal"]]
@@ -1222,12 +1477,13 @@ def create_combined_sales_orders(d2c_orders: Dict, b2b_orders: Dict, order_date:
         return {
             "d2c_orders": d2c_orders_created,
             "b2b_orders": b2b_orders_created,
-            "total": len(created_orders)
+            "total": len(created_orders),
+            "failed_orders": failed_order_names
         }
         
     except Exception as e:
-        # Remove rollback - no transaction was started at this level
-        # frappe.db.rollback()  # REMOVED
+        # Failing groups are handled above; this is a failure before any group was created,
+        # so none of the orders got their sales orders
         error_print(f"Error in create_combined_sales_orders: {str(e)}")
         log_error(
             error_category="Order Processing",
@@ -1243,10 +1499,175 @@ def create_combined_sales_orders(d2c_orders: Dict, b2b_orders: Dict, order_date:
         return {
             "d2c_orders": [],
             "b2b_orders": [],
-            "total": 0
+            "total": 0,
+            "failed_orders": [
+                order_name
+                for processed_orders in (d2c_orders, b2b_orders)
+                for plant_data in processed_orders.values()
+                for dc_data in plant_data.values()
+                for order_name in get_dc_group_order_names(dc_data)
+            ]
         }
 
 
+def get_dc_group_order_names(dc_data: Dict) -> List[str]:
+    """
+    Get the SF Order Master names of a plant -> DC group
+    
+    Args:
+        dc_data: darkstore -> {"items", "orders"} of the group
+    
+    Returns:
+        List of order names
+    """
+    return [order.name for darkstore_data in dc_data.values() for order in darkstore_data.get("orders", [])]
+
+
+def exclude_failed_orders(processing_results: Dict, failed_order_names: List[str]) -> None:
+    """
+    Remove orders whose sales orders could not be created from the processing results,
+    so mark_orders_and_items_as_processed leaves them for the next run
+    
+    Args:
+        processing_results: Order processing results of process_order_items, changed in place
+        failed_order_names: SF Order Master names
+    """
+    if not failed_order_names:
+        return
+    
+    failed_order_names = set(failed_order_names)
+    for order_name in failed_order_names:
+        processing_results["item_processing_details"].pop(order_name, None)
+    processing_results["processed_orders"] = [
+        order for order in processing_results["processed_orders"]
+        if order["order_name"] not in failed_order_names
+    ]
+
+
+def load_facility_shipping_addresses(warehouses: List[str]) -> Dict[tuple, str]:
+    """
+    Load SF Facility Master shipping addresses for DC and darkstore warehouses in one query
+    
+    Args:
+        warehouses: Warehouse names
+    
+    Returns:
+        Dict of (warehouse, facility type) -> shipping_address
+    """
+    facility_address_map = {}
+    
+    if not warehouses:
+        return facility_address_map
+    
+    facilities = frappe.db.sql("""
+        SELECT warehouse, type, shipping_address
+        FROM `tabSF Facility Master`
+        WHERE type IN ('Distribution Center', 'Darkstore')
+        AND warehouse IN %(warehouses)s
+        AND IFNULL(shipping_address, '') != ''
+    """, {"warehouses": list(set(warehouses))}, as_dict=True)
+    
+    for facility in facilities:
+        facility_address_map.setdefault((facility.warehouse, facility.type), facility.shipping_address)
+    
+    debug_print(f"Loaded shipping addresses for {len(facility_address_map)} facilities")
+    return facility_address_map
+
+
+def create_sales_orders_for_dc_group(plant: str, dc: str, dc_data: Dict, order_date: str,
+                                     internal_customer: str, default_company: str,
+                                     facility_address_map: Optional[Dict] = None) -> List[Dict]:
+    """
+    Create all sales orders for one plant -> distribution center network:
+    the plant to DC transfer, the DC to darkstore transfers and the B2B customer orders.
+    Transaction handling is left to the caller.
+    
+    Returns:
+        List of created sales order result dicts
+    """
+    created_orders = []
+    
+    # Create ONE distribution center order (from plant to DC) with ALL items
+    dc_order = create_sales_order_for_distribution_center(
+        plant, dc, dc_data, order_date, internal_customer, default_company, True, "Internal",
+        facility_address_map
+    )
+    if dc_order:
+        created_orders.append(dc_order)
+        info_print(f"Created combined DC order: {dc_order['sales_order']}")
+    
+    # Process each darkstore
+    for darkstore, darkstore_data in dc_data.items():
+        if darkstore == "DC_DIRECT":
+            # Direct DC orders - create customer-specific orders for B2B only
+            created_orders.extend(create_customer_sales_orders(
+                create_sales_order_for_dc_direct_with_orders, "DC direct", dc,
+                darkstore_data["orders"], order_date, internal_customer, default_company
+            ))
+        
+        elif darkstore == "CLIENT":
+            # Direct plant to client orders - create customer-specific orders for B2B only
+            created_orders.extend(create_customer_sales_orders(
+                create_sales_order_for_plant_direct_with_orders, "plant direct", plant,
+                darkstore_data["orders"], order_date, internal_customer, default_company
+            ))
+        else:
+            # Regular darkstore orders
+            # Create ONE internal transfer (DC to Darkstore) with ALL items
+            if darkstore_data.get("items"):
+                darkstore_order = create_sales_order_for_darkstore(
+                    dc, darkstore, darkstore_data, order_date, internal_customer, default_company, True, "Internal",
+                    facility_address_map
+                )
+                if darkstore_order:
+                    created_orders.append(darkstore_order)
+                    info_print(f"Created combined darkstore order: {darkstore_order['sales_order']}")
+            
+            # Create customer-specific orders from darkstore to client (B2B only)
+            created_orders.extend(create_customer_sales_orders(
+                create_sales_order_for_darkstore_to_client_with_orders, "darkstore to client", darkstore,
+                darkstore_data["orders"], order_date, internal_customer, default_company
+            ))
+    
+    return created_orders
+
+
+def create_customer_sales_orders(create_sales_order, label: str, source_warehouse: str, orders: List[Dict],
+                                 order_date: str, internal_customer: str, default_company: str) -> List[Dict]:
+    """
+    Create one sales order per external B2B customer from the given orders
+    
+    Args:
+        create_sales_order: One of the create_sales_order_for_*_with_orders functions
+        label: Order description used in log messages
+        source_warehouse: Warehouse the customer orders are delivered from
+        orders: Orders of the darkstore / DC / plant group (D2C orders are ignored)
+        order_date: Date in YYYY-MM-DD format
+        internal_customer: Internal customer, which never gets a customer order
+        default_company: Company for the sales orders
+    
+    Returns:
+        List of created sales order result dicts
+    """
+    created_orders = []
+    
+    b2b_orders_list = [order for order in orders if order.get("order_type") == "B2B"]
+    if not b2b_orders_list:
+        return created_orders
+    
+    customer_groups = group_b2b_orders_by_customer(b2b_orders_list)
+    for customer, customer_orders in customer_groups.items():
+        if customer != internal_customer:
+            customer_order = create_sales_order(
+                source_warehouse, customer_orders, order_date, customer, default_company, False
+            )
+            if customer_order:
+                created_orders.append(customer_order)
+                info_print(f"Created {label} order: {customer_order['sales_order']}")
+    
+    return created_orders
+
+
 def group_b2b_orders_by_customer(orders: List[Dict]) -> Dict[str, List[Dict]]:
     """
     Group B2B orders by customer
@@ -1254,30 +1675,31 @@ def group_b2b_orders_by_customer(orders: List[Dict]) -> Dict[str, List[Dict]]:
     """
     customer_groups = defaultdict(list)
     
+    # Preload mappings and existing customers for all orders instead of querying per order
+    mapping_by_external_id, existing_customers = load_customer_mappings(
+        list({order.get("customer_id") for order in orders if order.get("customer_id")})
+    )
+    
     for order in orders:
         customer_id = order.get("customer_id")
         if customer_id:
             # Look up customer mapping
-            customer_mapping = frappe.db.get_value(
-                "SF Inventory External ID Mapping",
-                {
-                    "entity_type": "Customer",
-                    "external_id": customer_id
-                },
-                ["internal_reference", "reference_doctype"],
-                as_dict=True
-            )
+            customer_mapping = mapping_by_external_id.get(customer_id)
             
             if customer_mapping and customer_mapping.internal_reference and customer_mapping.reference_doctype == "Customer":
-                if frappe.db.exists("Customer", customer_mapping.internal_reference):
+                if customer_mapping.internal_reference in existing_customers:
                     customer_groups[customer_mapping.internal_reference].append(order)
-                    debug_print(f"Grouped order {order.name} under customer {customer_mapping.internal_reference}")
+                    if DEBUG:
+                        debug_print(f"Grouped order {order.name} under customer {customer_mapping.internal_reference}")
                 else:
-                    debug_print(f"Customer {customer_mapping.internal_reference} does not exist, skipping order {order.name}")
+                    if DEBUG:
+                        debug_print(f"Customer {customer_mapping.internal_reference} does not exist, skipping order {order.name}")
             else:
-                debug_print(f"No valid customer mapping for customer_id {customer_id}, skipping order {order.name}")
+                if DEBUG:
+                    debug_print(f"No valid customer mapping for customer_id {customer_id}, skipping order {order.name}")
         else:
-            debug_print(f"No customer_id in order {order.name}, skipping")
+            if DEBUG:
+                debug_print(f"No customer_id in order {order.name}, skipping")
     
     return dict(customer_groups)
 
@@ -1295,51 +1717,17 @@ def create_sales_order_for_distribution_center_with_items(plant_warehouse: str,
             debug_print(f"No items to aggregate for DC {dc_warehouse}")
             return None
         
-        # Create sales order
-        sales_order_data = {
-            "doctype": "Sales Order",
-            "customer": customer,
-            "transaction_date": order_date,
-            "delivery_date": add_days(order_date, 1),
-            "company": company,
-            "set_warehouse": plant_warehouse,  # Source warehouse (Plant)
-            "items": []
-        }
-        
-        # Only set target warehouse for internal customers
-        if is_internal:
-            sales_order_data["custom_set_target_warehouse"] = dc_warehouse
-        
-        sales_order = frappe.get_doc(sales_order_data)
-        
-        # Add aggregated items
-        for item_code, quantity in aggregated_items.items():
-            if quantity > 0:
-                sales_order.append("items", {
-                    "item_code": item_code,
-                    "qty": quantity,
-                    "warehouse": plant_warehouse,
-                    "delivery_date": add_days(order_date, 1)
-                })
+        result = _create_transfer_sales_order(
+            plant_warehouse, dc_warehouse, aggregated_items, order_date,
+            customer, company, is_internal, order_type, "distribution_center_order"
+        )
         
-        if not sales_order.items:
+        if not result:
             debug_print(f"No items to add to DC sales order for {dc_warehouse}")
             return None
-            
-        sales_order.insert()
-        sales_order.submit()
-        
-        debug_print(f"Successfully created DC sales order {sales_order.name}")
         
-        return {
-            "type": "distribution_center_order",
-            "order_type": order_type,
-            "sales_order": sales_order.name,
-            "from_warehouse": plant_warehouse,
-            "to_warehouse": dc_warehouse,
-            "items_count": len(sales_order.items),
-            "total_qty": sum(item.qty for item in sales_order.items)
-        }
+        debug_print(f"Successfully created DC sales order {result['sales_order']}")
+        return result
         
     except Exception as e:
         error_print(f"Error creating distribution center sales order: {str(e)}")
@@ -1361,113 +1749,156 @@ def create_sales_order_for_distribution_center_with_items(plant_warehouse: str,
         return None
 
 
+@lru_cache(maxsize=8)
+def get_delivery_date(order_date: str):
+    """
+    Delivery date of the sales orders created for order_date (the following day).
+    Every sales order of a run shares the order date, so it is computed once per date.
+    """
+    return add_days(order_date, 1)
+
+
+def _build_sales_order_items(aggregated_items: Dict[str, float], warehouse: str,
+                             delivery_date: str) -> tuple[List[Dict], float]:
+    """
+    Build the Sales Order Item rows for the positive quantities and total them in the same pass.
+    The rows are passed with the parent in frappe.get_doc so the document is
+    constructed in one go instead of appending (and instantiating) one row at a
+    time. They are still inserted through the document, not with a raw INSERT,
+    so ERPNext's item validation and the submit-time reserved qty updates run.
+    
+    Args:
+        aggregated_items: Dict of item_code -> quantity, non-positive quantities are skipped
+        warehouse: Source warehouse of every row
+        delivery_date: Delivery date of every row
+    
+    Returns:
+        Tuple of (child row dicts for the "items" table, total quantity of the rows)
+    """
+    items = []
+    total_qty = 0.0
+    
+    for item_code, quantity in aggregated_items.items():
+        if quantity > 0:
+            items.append({
+                "item_code": item_code,
+                "qty": quantity,
+                "warehouse": warehouse,
+                "delivery_date": delivery_date
+            })
+            total_qty += quantity
+    
+    return items, total_qty
+
+
+def _create_transfer_sales_order(source_warehouse: str, target_warehouse: Optional[str],
+                                 aggregated_items: Dict[str, float], order_date: str,
+                                 customer: str, company: str, is_internal: bool, order_type: str,
+                                 result_type: str, shipping_address: Optional[str] = None) -> Optional[Dict]:
+    """
+    Build, insert and submit a Sales Order for aggregated items.
+    Shared by all create_sales_order_for_* functions. The submitted insert runs
+    inside a savepoint so a failed order is rolled back without discarding the
+    other orders of the enclosing transaction (see create_combined_sales_orders);
+    error logging is left to the callers.
+    
+    Args:
+        source_warehouse: Warehouse the items are delivered from
+        target_warehouse: Destination warehouse, None for deliveries to a customer
+        aggregated_items: Dict of item_code -> quantity
+        order_date: Transaction date, delivery is the following day
+        customer: Customer for the sales order
+        company: Company for the sales order
+        is_internal: Whether this is an internal transfer (sets the target warehouse)
+        order_type: "D2C", "B2B" or "Internal"
+        result_type: Value of the "type" key in the returned dict
+        shipping_address: Optional shipping address name
+    
+    Returns:
+        Dict describing the created sales order, or None if there were no items to add
+    """
+    delivery_date = get_delivery_date(order_date)
+    items, total_qty = _build_sales_order_items(aggregated_items, source_warehouse, delivery_date)
+    
+    if not items:
+        return None
+    
+    sales_order_data = SALES_ORDER_TEMPLATE.copy()
+    sales_order_data.update(
+        customer=customer,
+        transaction_date=order_date,
+        delivery_date=delivery_date,
+        company=company,
+        set_warehouse=source_warehouse,
+        items=items
+    )
+    
+    if shipping_address:
+        sales_order_data["shipping_address_name"] = shipping_address
+    
+    # Only set target warehouse for internal customers
+    if is_internal:
+        sales_order_data["custom_set_target_warehouse"] = target_warehouse or source_warehouse
+    
+    sales_order = frappe.get_doc(sales_order_data)
+    
+    frappe.db.savepoint(SALES_ORDER_SAVEPOINT)
+    try:
+        sales_order.insert()
+    except Exception:
+        frappe.db.rollback(save_point=SALES_ORDER_SAVEPOINT)
+        raise
+    
+    result = {
+        "type": result_type,
+        "order_type": order_type,
+        "sales_order": sales_order.name,
+        "from_warehouse": source_warehouse
+    }
+    
+    if target_warehouse:
+        result["to_warehouse"] = target_warehouse
+    else:
+        result["to_customer"] = customer
+    
+    # Totals come from the row building pass instead of walking the child table again
+    result["items_count"] = len(items)
+    result["total_qty"] = total_qty
+    
+    return result
+
+
 def create_sales_order_for_dc_direct_with_orders(dc_warehouse: str, customer_orders: List[Dict], order_date: str,
                                                customer: str, company: str, is_internal: bool) -> Optional[Dict]:
     """
     Create sales order for direct DC to client with specific orders
     """
-    # Check if we're already in a transaction
-    in_transaction = hasattr(frappe.db, 'transaction_writes') and frappe.db.transaction_writes > 0
-    transaction_started = False
-    
-    if not in_transaction:
-        # Start transaction only if not already in one
-        frappe.db.begin()
-        transaction_started = True
-    
     try:
         debug_print(f"Creating direct DC to client sales order for {dc_warehouse} with {len(customer_orders)} orders")
         
         # Aggregate items from the specific customer orders
-        aggregated_items = defaultdict(float)
-        for order in customer_orders:
-            order_items = frappe.db.sql("""
-                SELECT item_id, item_name, quantity, sf_product_master
-                FROM `tabSF Order Item`
-                WHERE parent = %(order_name)s
-                AND (is_item_processed IS NULL OR is_item_processed = 0)
-            """, {"order_name": order.name}, as_dict=True)
-            
-            for order_item in order_items:
-                if order_item.sf_product_master:
-                    sf_product = frappe.get_doc("SF Product Master", order_item.sf_product_master)
-                    if sf_product.is_combo:
-                        combo_items = validate_and_expand_combo_items(sf_product, order_item.quantity, order.name)
-                        if combo_items:
-                            for item_code, qty in combo_items.items():
-                                aggregated_items[item_code] += qty
-                    else:
-                        if sf_product.item_link:
-                            aggregated_items[sf_product.item_link] += order_item.quantity
+        aggregated_items = _aggregate_items_for_orders(customer_orders)
         
         if not aggregated_items:
             debug_print(f"No items to aggregate for DC direct order {dc_warehouse}")
-            if transaction_started:
-                frappe.db.rollback()
             return None
         
         # Get customer address for shipping
         customer_address = get_customer_shipping_address(customer)
         
-        # Create sales order
-        sales_order_data = {
-            "doctype": "Sales Order",
-            "customer": customer,
-            "transaction_date": order_date,
-            "delivery_date": add_days(order_date, 1),
-            "company": company,
-            "set_warehouse": dc_warehouse,  # Source warehouse (DC)
-            "items": []
-        }
-        
-        if customer_address:
-            sales_order_data["shipping_address_name"] = customer_address
-        
-        # Only set target warehouse for internal customers
-        if is_internal:
-            sales_order_data["custom_set_target_warehouse"] = dc_warehouse
-        
-        sales_order = frappe.get_doc(sales_order_data)
-        
-        # Add aggregated items
-        for item_code, quantity in aggregated_items.items():
-            if quantity > 0:
-                sales_order.append("items", {
-                    "item_code": item_code,
-                    "qty": quantity,
-                    "warehouse": dc_warehouse,
-                    "delivery_date": add_days(order_date, 1)
-                })
+        result = _create_transfer_sales_order(
+            dc_warehouse, None, aggregated_items, order_date,
+            customer, company, is_internal, "B2B", "dc_direct_order", customer_address
+        )
         
-        if not sales_order.items:
+        if not result:
             debug_print(f"No items to add to DC direct sales order for {dc_warehouse}")
-            if transaction_started:
-                frappe.db.rollback()
             return None
-            
-        sales_order.insert()
-        sales_order.submit()
-        
-        # Commit the transaction only if we started it
-        if transaction_started:
-            frappe.db.commit()
         
-        debug_print(f"Successfully created DC direct sales order {sales_order.name}")
-        
-        return {
-            "type": "dc_direct_order",
-            "order_type": "B2B",
-            "sales_order": sales_order.name,
-            "from_warehouse": dc_warehouse,
-            "to_customer": customer,
-            "items_count": len(sales_order.items),
-            "total_qty": sum(item.qty for item in sales_order.items)
-        }
+        debug_print(f"Successfully created DC direct sales order {result['sales_order']}")
+        return result
         
     except Exception as e:
-        # Rollback only if we started the transaction
-        if transaction_started:
-            frappe.db.rollback()
         error_print(f"Error creating DC direct sales order: {str(e)}")
         log_error(
             error_category="Order Processing",
@@ -1492,108 +1923,32 @@ def create_sales_order_for_plant_direct_with_orders(plant_warehouse: str, custom
     """
     Create sales order for direct plant to client with specific orders
     """
-    # Check if we're already in a transaction
-    in_transaction = hasattr(frappe.db, 'transaction_writes') and frappe.db.transaction_writes > 0
-    transaction_started = False
-    
-    if not in_transaction:
-        # Start transaction only if not already in one
-        frappe.db.begin()
-        transaction_started = True
-    
     try:
         debug_print(f"Creating direct plant to client sales order for {plant_warehouse} with {len(customer_orders)} orders")
         
         # Aggregate items from the specific customer orders
-        aggregated_items = defaultdict(float)
-        for order in customer_orders:
-            order_items = frappe.db.sql("""
-                SELECT item_id, item_name, quantity, sf_product_master
-                FROM `tabSF Order Item`
-                WHERE parent = %(order_name)s
-                AND (is_item_processed IS NULL OR is_item_processed = 0)
-            """, {"order_name": order.name}, as_dict=True)
-            
-            for order_item in order_items:
-                if order_item.sf_product_master:
-                    sf_product = frappe.get_doc("SF Product Master", order_item.sf_product_master)
-                    if sf_product.is_combo:
-                        combo_items = validate_and_expand_combo_items(sf_product, order_item.quantity, order.name)
-                        if combo_items:
-                            for item_code, qty in combo_items.items():
-                                aggregated_items[item_code] += qty
-                    else:
-                        if sf_product.item_link:
-                            aggregated_items[sf_product.item_link] += order_item.quantity
+        aggregated_items = _aggregate_items_for_orders(customer_orders)
         
         if not aggregated_items:
             debug_print(f"No items to aggregate for plant direct order {plant_warehouse}")
-            if transaction_started:
-                frappe.db.rollback()
             return None
         
         # Get customer address for shipping
         customer_address = get_customer_shipping_address(customer)
         
-        # Create sales order
-        sales_order_data = {
-            "doctype": "Sales Order",
-            "customer": customer,
-            "transaction_date": order_date,
-            "delivery_date": add_days(order_date, 1),
-            "company": company,
-            "set_warehouse": plant_warehouse,  # Source warehouse (Plant)
-            "items": []
-        }
-        
-        if customer_address:
-            sales_order_data["shipping_address_name"] = customer_address
-        
-        # Only set target warehouse for internal customers
-        if is_internal:
-            sales_order_data["custom_set_target_warehouse"] = plant_warehouse
-        
-        sales_order = frappe.get_doc(sales_order_data)
-        
-        # Add aggregated items
-        for item_code, quantity in aggregated_items.items():
-            if quantity > 0:
-                sales_order.append("items", {
-                    "item_code": item_code,
-                    "qty": quantity,
-                    "warehouse": plant_warehouse,
-                    "delivery_date": add_days(order_date, 1)
-                })
+        result = _create_transfer_sales_order(
+            plant_warehouse, None, aggregated_items, order_date,
+            customer, company, is_internal, "B2B", "plant_direct_order", customer_address
+        )
         
-        if not sales_order.items:
+        if not result:
             debug_print(f"No items to add to plant direct sales order for {plant_warehouse}")
-            if transaction_started:
-                frappe.db.rollback()
             return None
-            
-        sales_order.insert()
-        sales_order.submit()
         
-        # Commit the transaction only if we started it
-        if transaction_started:
-            frappe.db.commit()
-        
-        debug_print(f"Successfully created plant direct sales order {sales_order.name}")
-        
-        return {
-            "type": "plant_direct_order",
-            "order_type": "B2B",
-            "sales_order": sales_order.name,
-            "from_warehouse": plant_warehouse,
-            "to_customer": customer,
-            "items_count": len(sales_order.items),
-            "total_qty": sum(item.qty for item in sales_order.items)
-        }
+        debug_print(f"Successfully created plant direct sales order {result['sales_order']}")
+        return result
         
     except Exception as e:
-        # Rollback only if we started the transaction
-        if transaction_started:
-            frappe.db.rollback()
         error_print(f"Error creating plant direct sales order: {str(e)}")
         log_error(
             error_category="Order Processing",
@@ -1618,108 +1973,32 @@ def create_sales_order_for_darkstore_to_client_with_orders(darkstore_warehouse:
     """
     Create sales order for Darkstore to Client with specific orders
     """
-    # Check if we're already in a transaction
-    in_transaction = hasattr(frappe.db, 'transaction_writes') and frappe.db.transaction_writes > 0
-    transaction_started = False
-    
-    if not in_transaction:
-        # Start transaction only if not already in one
-        frappe.db.begin()
-        transaction_started = True
-    
     try:
         debug_print(f"Creating darkstore to client sales order for {darkstore_warehouse} with {len(customer_orders)} orders")
         
         # Aggregate items from the specific customer orders
-        aggregated_items = defaultdict(float)
-        for order in customer_orders:
-            order_items = frappe.db.sql("""
-                SELECT item_id, item_name, quantity, sf_product_master
-                FROM `tabSF Order Item`
-                WHERE parent = %(order_name)s
-                AND (is_item_processed IS NULL OR is_item_processed = 0)
-            """, {"order_name": order.name}, as_dict=True)
-            
-            for order_item in order_items:
-                if order_item.sf_product_master:
-                    sf_product = frappe.get_doc("SF Product Master", order_item.sf_product_master)
-                    if sf_product.is_combo:
-                        combo_items = validate_and_expand_combo_items(sf_product, order_item.quantity, order.name)
-                        if combo_items:
-                            for item_code, qty in combo_items.items():
-                                aggregated_items[item_code] += qty
-                    else:
-                        if sf_product.item_link:
-                            aggregated_items[sf_product.item_link] += order_item.quantity
+        aggregated_items = _aggregate_items_for_orders(customer_orders)
         
         if not aggregated_items:
             debug_print(f"No items to aggregate for darkstore to client order {darkstore_warehouse}")
-            if transaction_started:
-                frappe.db.rollback()
             return None
         
         # Get customer address for shipping
         customer_address = get_customer_shipping_address(customer)
         
-        # Create sales order
-        sales_order_data = {
-            "doctype": "Sales Order",
-            "customer": customer,
-            "transaction_date": order_date,
-            "delivery_date": add_days(order_date, 1),
-            "company": company,
-            "set_warehouse": darkstore_warehouse,  # Source warehouse (Darkstore)
-            "items": []
-        }
-        
-        if customer_address:
-            sales_order_data["shipping_address_name"] = customer_address
-        
-        # Only set target warehouse for internal customers
-        if is_internal:
-            sales_order_data["custom_set_target_warehouse"] = darkstore_warehouse
-        
-        sales_order = frappe.get_doc(sales_order_data)
-        
-        # Add aggregated items
-        for item_code, quantity in aggregated_items.items():
-            if quantity > 0:
-                sales_order.append("items", {
-                    "item_code": item_code,
-                    "qty": quantity,
-                    "warehouse": darkstore_warehouse,
-                    "delivery_date": add_days(order_date, 1)
-                })
+        result = _create_transfer_sales_order(
+            darkstore_warehouse, None, aggregated_items, order_date,
+            customer, company, is_internal, "B2B", "darkstore_to_client_order", customer_address
+        )
         
-        if not sales_order.items:
+        if not result:
             debug_print(f"No items to add to darkstore to client sales order for {darkstore_warehouse}")
-            if transaction_started:
-                frappe.db.rollback()
             return None
-            
-        sales_order.insert()
-        sales_order.submit()
-        
-        # Commit the transaction only if we started it
-        if transaction_started:
-            frappe.db.commit()
-        
-        debug_print(f"Successfully created darkstore to client sales order {sales_order.name}")
         
-        return {
-            "type": "darkstore_to_client_order",
-            "order_type": "B2B",
-            "sales_order": sales_order.name,
-            "from_warehouse": darkstore_warehouse,
-            "to_customer": customer,
-            "items_count": len(sales_order.items),
-            "total_qty": sum(item.qty for item in sales_order.items)
-        }
+        debug_print(f"Successfully created darkstore to client sales order {result['sales_order']}")
+        return result
         
     except Exception as e:
-        # Rollback only if we started the transaction
-        if transaction_started:
-            frappe.db.rollback()
         error_print(f"Error creating darkstore to client sales order: {str(e)}")
         log_error(
             error_category="Order Processing",
@@ -1739,85 +2018,148 @@ def create_sales_order_for_darkstore_to_client_with_orders(darkstore_warehouse:
         return None
 
 
+def load_customer_mappings(customer_ids: List[str]) -> tuple[Dict[str, Any], set]:
+    """
+    Load the SF Inventory External ID Mapping records for the given customer_ids
+    and check which mapped ERPNext Customers exist, in two queries.
+    The primary addresses of the existing customers are added to the shipping
+    address cache of the current aggregation run.
+    
+    Args:
+        customer_ids: External customer ids from SF Order Master
+    
+    Returns:
+        Tuple of (external_id -> mapping record, set of existing Customer names)
+    """
+    mapping_by_external_id = {}
+    existing_customers = set()
+    
+    if not customer_ids:
+        return mapping_by_external_id, existing_customers
+    
+    mappings = frappe.db.sql("""
+        SELECT external_id, internal_reference, reference_doctype
+        FROM `tabSF Inventory External ID Mapping`
+        WHERE entity_type = 'Customer'
+        AND external_id IN %(customer_ids)s
+        ORDER BY creation DESC
+    """, {"customer_ids": list(customer_ids)}, as_dict=True)
+    
+    for mapping in mappings:
+        # Keep the latest mapping per external id
+        mapping_by_external_id.setdefault(mapping.external_id, mapping)
+    
+    candidate_customers = [
+        mapping.internal_reference for mapping in mapping_by_external_id.values()
+        if mapping.internal_reference and mapping.reference_doctype == "Customer"
+    ]
+    
+    if candidate_customers:
+        customers = frappe.db.sql("""
+            SELECT name, customer_primary_address
+            FROM `tabCustomer`
+            WHERE name IN %(customers)s
+        """, {"customers": candidate_customers}, as_dict=True)
+        
+        existing_customers = {customer.name for customer in customers}
+        
+        # The same query primes the shipping addresses used when the customer orders are created
+        # (see get_customer_shipping_address)
+        address_cache = getattr(frappe.local, 'customer_shipping_address_cache', None)
+        if address_cache is not None:
+            for customer in customers:
+                address_cache[customer.name] = customer.customer_primary_address or None
+    
+    return mapping_by_external_id, existing_customers
+
+
 def get_b2b_customer_from_orders(dc_data: Dict) -> str:
     """
     Get the customer from B2B orders in the DC data
     Uses SF Inventory External ID Mapping to look up customer_id to ERPNext Customer
     """
+    # Each customer_id is checked (and logged) once, against the first order that carries it
+    first_order_by_customer_id = {}
     for darkstore_data in dc_data.values():
         for order in darkstore_data.get("orders", []):
-            # Get customer_id from the order
             customer_id = order.get("customer_id")
-            if customer_id:
-                # Look up in SF Inventory External ID Mapping
-                customer_mapping = frappe.db.get_value(
-                    "SF Inventory External ID Mapping",
-                    {
-                        "entity_type": "Customer",
-                        "external_id": customer_id
-                    },
-                    ["internal_reference", "reference_doctype"],
-                    as_dict=True
-                )
+            if customer_id and customer_id not in first_order_by_customer_id:
+                first_order_by_customer_id[customer_id] = order
+    
+    mapping_by_external_id, existing_customers = load_customer_mappings(list(first_order_by_customer_id))
+    
+    customer = None
+    pending_errors = []
+    
+    for customer_id, order in first_order_by_customer_id.items():
+        # Look up in the preloaded SF Inventory External ID Mapping records
+        customer_mapping = mapping_by_external_id.get(customer_id)
+        
+        if customer_mapping and customer_mapping.internal_reference:
+            # Verify the reference_doctype is Customer
+            if customer_mapping.reference_doctype == "Customer":
+                # Verify the customer exists in ERPNext
+                if customer_mapping.internal_reference in existing_customers:
+                    debug_print(f"Found customer mapping: {customer_id} -> {customer_mapping.internal_reference}")
+                    customer = customer_mapping.internal_reference
+                    break
                 
-                if customer_mapping and customer_mapping.internal_reference:
-                    # Verify the reference_doctype is Customer
-                    if customer_mapping.reference_doctype == "Customer":
-                        # Verify the customer exists in ERPNext
-                        if frappe.db.exists("Customer", customer_mapping.internal_reference):
-                            debug_print(f"Found customer mapping: {customer_id} -> {customer_mapping.internal_reference}")
-                            return customer_mapping.internal_reference
-                        else:
-                            error_print(f"Customer {customer_mapping.internal_reference} from mapping does not exist in ERPNext")
-                            log_error(
-                                error_category="Missing Reference",
-                                error_description=f"Customer {customer_mapping.internal_reference} from mapping does not exist in ERPNext",
-                                processing_stage="Customer Validation",
-                                entity_type="Customer",
-                                external_id=customer_id,
-                                reference_doctype="Customer",
-                                internal_reference=customer_mapping.internal_reference,
-                                error_severity="High",
-                                additional_detail={
-                                    "order_name": order.name,
-                                    "order_id": order.order_id,
-                                    "customer_id": customer_id,
-                                    "mapped_customer": customer_mapping.internal_reference
-                                }
-                            )
-                    else:
-                        error_print(f"Invalid reference_doctype in customer mapping: {customer_mapping.reference_doctype}")
-                        log_error(
-                            error_category="Data Mapping",
-                            error_description=f"Invalid reference_doctype in customer mapping: {customer_mapping.reference_doctype}",
-                            processing_stage="Customer Validation",
-                            entity_type="Customer",
-                            external_id=customer_id,
-                            reference_doctype="SF Inventory External ID Mapping",
-                            error_severity="High",
-                            additional_detail={
-                                "order_name": order.name,
-                                "order_id": order.order_id,
-                                "customer_id": customer_id,
-                                "reference_doctype": customer_mapping.reference_doctype
-                            }
-                        )
-                else:
-                    error_print(f"No customer mapping found for customer_id: {customer_id}")
-                    log_error(
-                        error_category="Missing Reference",
-                        error_description=f"No customer mapping found for customer_id: {customer_id}",
-                        processing_stage="Customer Validation",
-                        entity_type="Customer",
-                        external_id=customer_id,
-                        reference_doctype="SF Inventory External ID Mapping",
-                        error_severity="High",
-                        additional_detail={
-                            "order_name": order.name,
-                            "order_id": order.order_id,
-                            "customer_id": customer_id
-                        }
-                    )
+                error_print(f"Customer {customer_mapping.internal_reference} from mapping does not exist in ERPNext")
+                pending_errors.append({
+                    "error_category": "Missing Reference",
+                    "error_description": f"Customer {customer_mapping.internal_reference} from mapping does not exist in ERPNext",
+                    "processing_stage": "Customer Validation",
+                    "entity_type": "Customer",
+                    "external_id": customer_id,
+                    "reference_doctype": "Customer",
+                    "internal_reference": customer_mapping.internal_reference,
+                    "error_severity": "High",
+                    "additional_detail": {
+                        "order_name": order.name,
+                        "order_id": order.order_id,
+                        "customer_id": customer_id,
+                        "mapped_customer": customer_mapping.internal_reference
+                    }
+                })
+            else:
+                error_print(f"Invalid reference_doctype in customer mapping: {customer_mapping.reference_doctype}")
+                pending_errors.append({
+                    "error_category": "Data Mapping",
+                    "error_description": f"Invalid reference_doctype in customer mapping: {customer_mapping.reference_doctype}",
+                    "processing_stage": "Customer Validation",
+                    "entity_type": "Customer",
+                    "external_id": customer_id,
+                    "reference_doctype": "SF Inventory External ID Mapping",
+                    "error_severity": "High",
+                    "additional_detail": {
+                        "order_name": order.name,
+                        "order_id": order.order_id,
+                        "customer_id": customer_id,
+                        "reference_doctype": customer_mapping.reference_doctype
+                    }
+                })
+        else:
+            error_print(f"No customer mapping found for customer_id: {customer_id}")
+            pending_errors.append({
+                "error_category": "Missing Reference",
+                "error_description": f"No customer mapping found for customer_id: {customer_id}",
+                "processing_stage": "Customer Validation",
+                "entity_type": "Customer",
+                "external_id": customer_id,
+                "reference_doctype": "SF Inventory External ID Mapping",
+                "error_severity": "High",
+                "additional_detail": {
+                    "order_name": order.name,
+                    "order_id": order.order_id,
+                    "customer_id": customer_id
+                }
+            })
+    
+    # Log the invalid mappings seen before a valid customer was found in one batch
+    log_errors_bulk(pending_errors)
+    
+    if customer:
+        return customer
     
     # Fallback to internal customer if no valid customer found
     debug_print("No valid B2B customer found, falling back to internal customer")
@@ -1826,19 +2168,13 @@ def get_b2b_customer_from_orders(dc_data: Dict) -> str:
 
 def create_sales_order_for_darkstore(dc_warehouse: str, darkstore_warehouse: str, 
                                    darkstore_data: Dict, order_date: str, 
-                                   customer: str, company: str, is_internal: bool, order_type: str) -> Optional[Dict]:
+                                   customer: str, company: str, is_internal: bool, order_type: str,
+                                   facility_address_map: Optional[Dict] = None) -> Optional[Dict]:
     """
     Create sales order for darkstore (from distribution center to darkstore)
+    facility_address_map: Optional preloaded (warehouse, type) -> shipping_address
+                          (see load_facility_shipping_addresses)
     """
-    # Check if we're already in a transaction
-    in_transaction = hasattr(frappe.db, 'transaction_writes') and frappe.db.transaction_writes > 0
-    transaction_started = False
-    
-    if not in_transaction:
-        # Start transaction only if not already in one
-        frappe.db.begin()
-        transaction_started = True
-    
     try:
         debug_print(f"Creating sales order for darkstore {darkstore_warehouse}")
         
@@ -1846,16 +2182,18 @@ def create_sales_order_for_darkstore(dc_warehouse: str, darkstore_warehouse: str
         shipping_address = None
         if is_internal:
             # Internal transfers use destination warehouse (darkstore) address
-            darkstore_facility = frappe.db.get_value(
-                "SF Facility Master",
-                {"warehouse": darkstore_warehouse, "type": "Darkstore"},
-                ["shipping_address"],
-                as_dict=True
-            )
-            
-            if darkstore_facility and darkstore_facility.shipping_address:
-                shipping_address = darkstore_facility.shipping_address
+            if facility_address_map is not None:
+                shipping_address = facility_address_map.get((darkstore_warehouse, "Darkstore"))
             else:
+                darkstore_facility = frappe.db.get_value(
+                    "SF Facility Master",
+                    {"warehouse": darkstore_warehouse, "type": "Darkstore"},
+                    ["shipping_address"],
+                    as_dict=True
+                )
+                shipping_address = darkstore_facility.shipping_address if darkstore_facility else None
+            
+            if not shipping_address:
                 # Fallback to warehouse address if facility address not found
                 warehouse_address = frappe.db.get_value(
                     "Warehouse",
@@ -1886,65 +2224,19 @@ def create_sales_order_for_darkstore(dc_warehouse: str, darkstore_warehouse: str
             # External orders use customer's shipping address
             shipping_address = get_customer_shipping_address(customer)
         
-        # Create sales order
-        sales_order_data = {
-            "doctype": "Sales Order",
-            "customer": customer,
-            "transaction_date": order_date,
-            "delivery_date": add_days(order_date, 1),
-            "company": company,
-            "set_warehouse": dc_warehouse,  # Source warehouse (DC)
-            "items": []
-        }
-        
-        if shipping_address:
-            sales_order_data["shipping_address_name"] = shipping_address
-        
-        # Only set target warehouse for internal customers
-        if is_internal:
-            sales_order_data["custom_set_target_warehouse"] = darkstore_warehouse
-        
-        sales_order = frappe.get_doc(sales_order_data)
-        
-        # Add items
-        for item_code, quantity in darkstore_data["items"].items():
-            if quantity > 0:
-                sales_order.append("items", {
-                    "item_code": item_code,
-                    "qty": quantity,
-                    "warehouse": dc_warehouse,
-                    "delivery_date": add_days(order_date, 1)
-                })
+        result = _create_transfer_sales_order(
+            dc_warehouse, darkstore_warehouse, darkstore_data["items"], order_date,
+            customer, company, is_internal, order_type, "darkstore_order", shipping_address
+        )
         
-        if not sales_order.items:
+        if not result:
             debug_print(f"No items to add to darkstore sales order for {darkstore_warehouse}")
-            if transaction_started:
-                frappe.db.rollback()
             return None
-            
-        sales_order.insert()
-        sales_order.submit()
         
-        # Commit the transaction only if we started it
-        if transaction_started:
-            frappe.db.commit()
-        
-        debug_print(f"Successfully created darkstore sales order {sales_order.name}")
-        
-        return {
-            "type": "darkstore_order",
-            "order_type": order_type,
-            "sales_order": sales_order.name,
-            "from_warehouse": dc_warehouse,
-            "to_warehouse": darkstore_warehouse,
-            "items_count": len(sales_order.items),
-            "total_qty": sum(item.qty for item in sales_order.items)
-        }
+        debug_print(f"Successfully created darkstore sales order {result['sales_order']}")
+        return result
         
     except Exception as e:
-        # Rollback only if we started the transaction
-        if transaction_started:
-            frappe.db.rollback()
         error_print(f"Error creating darkstore sales order: {str(e)}")
         log_error(
             error_category="Order Processing",
@@ -1966,19 +2258,13 @@ def create_sales_order_for_darkstore(dc_warehouse: str, darkstore_warehouse: str
 
 def create_sales_order_for_distribution_center(plant_warehouse: str, dc_warehouse: str,
                                              dc_data: Dict, order_date: str,
-                                             customer: str, company: str, is_internal: bool, order_type: str) -> Optional[Dict]:
+                                             customer: str, company: str, is_internal: bool, order_type: str,
+                                             facility_address_map: Optional[Dict] = None) -> Optional[Dict]:
     """
     Create sales order for distribution center (from plant to distribution center)
+    facility_address_map: Optional preloaded (warehouse, type) -> shipping_address
+                          (see load_facility_shipping_addresses)
     """
-    # Check if we're already in a transaction
-    in_transaction = hasattr(frappe.db, 'transaction_writes') and frappe.db.transaction_writes > 0
-    transaction_started = False
-    
-    if not in_transaction:
-        # Start transaction only if not already in one
-        frappe.db.begin()
-        transaction_started = True
-    
     try:
         debug_print(f"Creating sales order for distribution center {dc_warehouse}")
         
@@ -1991,8 +2277,6 @@ def create_sales_order_for_distribution_center(plant_warehouse: str, dc_warehous
         
         if not aggregated_items:
             debug_print(f"No items to aggregate for DC {dc_warehouse}")
-            if transaction_started:
-                frappe.db.rollback()
             return None
         
         # Determine shipping address based on whether it's internal or external
@@ -2000,16 +2284,18 @@ def create_sales_order_for_distribution_center(plant_warehouse: str, dc_warehous
         if is_internal:
             # Internal transfers use destination warehouse (DC) address
             # First try to get address from SF Facility Master
-            dc_facility = frappe.db.get_value(
-                "SF Facility Master",
-                {"warehouse": dc_warehouse, "type": "Distribution Center"},
-                ["shipping_address"],
-                as_dict=True
-            )
-            
-            if dc_facility and dc_facility.shipping_address:
-                shipping_address = dc_facility.shipping_address
+            if facility_address_map is not None:
+                shipping_address = facility_address_map.get((dc_warehouse, "Distribution Center"))
             else:
+                dc_facility = frappe.db.get_value(
+                    "SF Facility Master",
+                    {"warehouse": dc_warehouse, "type": "Distribution Center"},
+                    ["shipping_address"],
+                    as_dict=True
+                )
+                shipping_address = dc_facility.shipping_address if dc_facility else None
+            
+            if not shipping_address:
                 # Fallback to warehouse address
                 warehouse_address = frappe.db.get_value(
                     "Warehouse",
@@ -2023,65 +2309,19 @@ def create_sales_order_for_distribution_center(plant_warehouse: str, dc_warehous
             # External orders use customer's shipping address
             shipping_address = get_customer_shipping_address(customer)
         
-        # Create sales order
-        sales_order_data = {
-            "doctype": "Sales Order",
-            "customer": customer,
-            "transaction_date": order_date,
-            "delivery_date": add_days(order_date, 1),
-            "company": company,
-            "set_warehouse": plant_warehouse,  # Source warehouse (Plant)
-            "items": []
-        }
-        
-        if shipping_address:
-            sales_order_data["shipping_address_name"] = shipping_address
-        
-        # Only set target warehouse for internal customers
-        if is_internal:
-            sales_order_data["custom_set_target_warehouse"] = dc_warehouse
-        
-        sales_order = frappe.get_doc(sales_order_data)
-        
-        # Add aggregated items
-        for item_code, quantity in aggregated_items.items():
-            if quantity > 0:
-                sales_order.append("items", {
-                    "item_code": item_code,
-                    "qty": quantity,
-                    "warehouse": plant_warehouse,
-                    "delivery_date": add_days(order_date, 1)
-                })
+        result = _create_transfer_sales_order(
+            plant_warehouse, dc_warehouse, aggregated_items, order_date,
+            customer, company, is_internal, order_type, "distribution_center_order", shipping_address
+        )
         
-        if not sales_order.items:
+        if not result:
             debug_print(f"No items to add to DC sales order for {dc_warehouse}")
-            if transaction_started:
-                frappe.db.rollback()
             return None
-            
-        sales_order.insert()
-        sales_order.submit()
-        
-        # Commit the transaction only if we started it
-        if transaction_started:
-            frappe.db.commit()
         
-        debug_print(f"Successfully created DC sales order {sales_order.name}")
-        
-        return {
-            "type": "distribution_center_order",
-            "order_type": order_type,
-            "sales_order": sales_order.name,
-            "from_warehouse": plant_warehouse,
-            "to_warehouse": dc_warehouse,
-            "items_count": len(sales_order.items),
-            "total_qty": sum(item.qty for item in sales_order.items)
-        }
+        debug_print(f"Successfully created DC sales order {result['sales_order']}")
+        return result
         
     except Exception as e:
-        # Rollback only if we started the transaction
-        if transaction_started:
-            frappe.db.rollback()
         error_print(f"Error creating distribution center sales order: {str(e)}")
         log_error(
             error_category="Order Processing",
@@ -2101,208 +2341,64 @@ def create_sales_order_for_distribution_center(plant_warehouse: str, dc_warehous
         return None
 
 
-def create_sales_order_for_dc_direct(dc_warehouse: str, dc_data: Dict, order_date: str,
-                                   customer: str, company: str, is_internal: bool) -> Optional[Dict]:
-    """
-    Create sales order for direct DC to client (B2B orders)
-    """
-    try:
-        debug_print(f"Creating direct DC to client sales order for {dc_warehouse}")
-        
-        # Get customer address for shipping
-        customer_address = get_customer_shipping_address(customer)
-        
-        # Create sales order
-        sales_order_data = {
-            "doctype": "Sales Order",
-            "customer": customer,
-            "transaction_date": order_date,
-            "delivery_date": add_days(order_date, 1),
-            "company": company,
-            "set_warehouse": dc_warehouse,  # Source warehouse (DC)
-            "items": []
-        }
-        
-        if customer_address:
-            sales_order_data["shipping_address_name"] = customer_address
-        
-        # Only set target warehouse for internal customers
-        if is_internal:
-            sales_order_data["custom_set_target_warehouse"] = dc_warehouse
-        
-        sales_order = frappe.get_doc(sales_order_data)
-        
-        # Add items
-        for item_code, quantity in dc_data["items"].items():
-            if quantity > 0:
-                sales_order.append("items", {
-                    "item_code": item_code,
-                    "qty": quantity,
-                    "warehouse": dc_warehouse,
-                    "delivery_date": add_days(order_date, 1)
-                })
-        
-        if not sales_order.items:
-            debug_print(f"No items to add to DC direct sales order for {dc_warehouse}")
-            return None
-            
-        sales_order.insert()
-        sales_order.submit()
-        
-        debug_print(f"Successfully created DC direct sales order {sales_order.name}")
-        
-        return {
-            "type": "dc_direct_order",
-            "order_type": "B2B",
-            "sales_order": sales_order.name,
-            "from_warehouse": dc_warehouse,
-            "to_customer": customer,
-            "items_count": len(sales_order.items),
-            "total_qty": sum(item.qty for item in sales_order.items)
-        }
-        
-    except Exception as e:
-        error_print(f"Error creating DC direct sales order: {str(e)}")
-        return None
+# Result type and log label of the direct-to-client sales orders by source warehouse type
+DIRECT_SALES_ORDER_TYPES = {
+    "dc": ("dc_direct_order", "DC direct"),
+    "plant": ("plant_direct_order", "plant direct"),
+    "darkstore": ("darkstore_to_client_order", "darkstore to client"),
+}
 
 
-def create_sales_order_for_plant_direct(plant_warehouse: str, plant_data: Dict, order_date: str,
-                                      customer: str, company: str, is_internal: bool) -> Optional[Dict]:
-    """
-    Create sales order for direct plant to client (B2B orders)
+def _create_direct_sales_order(source_warehouse: str, source_type: str, data: Dict, order_date: str,
+                               customer: str, company: str, is_internal: bool) -> Optional[Dict]:
     """
-    try:
-        debug_print(f"Creating direct plant to client sales order for {plant_warehouse}")
-        
-        # Get customer address for shipping
-        customer_address = get_customer_shipping_address(customer)
-        
-        # Create sales order
-        sales_order_data = {
-            "doctype": "Sales Order",
-            "customer": customer,
-            "transaction_date": order_date,
-            "delivery_date": add_days(order_date, 1),
-            "company": company,
-            "set_warehouse": plant_warehouse,  # Source warehouse (Plant)
-            "items": []
-        }
-        
-        if customer_address:
-            sales_order_data["shipping_address_name"] = customer_address
-        
-        # Only set target warehouse for internal customers
-        if is_internal:
-            sales_order_data["custom_set_target_warehouse"] = plant_warehouse
-        
-        sales_order = frappe.get_doc(sales_order_data)
-        
-        # Add items
-        for item_code, quantity in plant_data["items"].items():
-            if quantity > 0:
-                sales_order.append("items", {
-                    "item_code": item_code,
-                    "qty": quantity,
-                    "warehouse": plant_warehouse,
-                    "delivery_date": add_days(order_date, 1)
-                })
-        
-        if not sales_order.items:
-            debug_print(f"No items to add to plant direct sales order for {plant_warehouse}")
-            return None
-            
-        sales_order.insert()
-        sales_order.submit()
-        
-        debug_print(f"Successfully created plant direct sales order {sales_order.name}")
-        
-        return {
-            "type": "plant_direct_order",
-            "order_type": "B2B",
-            "sales_order": sales_order.name,
-            "from_warehouse": plant_warehouse,
-            "to_customer": customer,
-            "items_count": len(sales_order.items),
-            "total_qty": sum(item.qty for item in sales_order.items)
-        }
-        
-    except Exception as e:
-        error_print(f"Error creating plant direct sales order: {str(e)}")
-        return None
-
-
-def create_sales_order_for_darkstore_to_client(darkstore_warehouse: str, darkstore_data: Dict, order_date: str,
-                                               customer: str, company: str, is_internal: bool) -> Optional[Dict]:
-    """
-    Create sales order for Darkstore to Client (B2B orders)
-    This creates the final sales order from Darkstore directly to the B2B client
+    Create a direct-to-client sales order (B2B orders) from a DC, plant or darkstore
+    Shared by create_sales_order_for_dc_direct, create_sales_order_for_plant_direct
+    and create_sales_order_for_darkstore_to_client.
+    
+    Args:
+        source_warehouse: Warehouse the items are delivered from
+        source_type: "dc", "plant" or "darkstore" (see DIRECT_SALES_ORDER_TYPES)
+        data: Aggregated data with an "items" dict of item_code -> quantity
+        order_date: Date in YYYY-MM-DD format
+        customer: Customer for the sales order
+        company: Company for the sales order
+        is_internal: Whether this is an internal transfer
+    
+    Returns:
+        Dict describing the created sales order, or None if nothing was created
     """
+    result_type, label = DIRECT_SALES_ORDER_TYPES[source_type]
+    
     try:
-        debug_print(f"Creating darkstore to client sales order for {darkstore_warehouse}")
+        debug_print(f"Creating {label} sales order for {source_warehouse}")
         
-        # Get customer address for shipping (B2B orders use customer address, not darkstore address)
+        # Get customer address for shipping (B2B orders use customer address, not warehouse address)
         customer_address = get_customer_shipping_address(customer)
         
-        # Create sales order
-        sales_order_data = {
-            "doctype": "Sales Order",
-            "customer": customer,
-            "transaction_date": order_date,
-            "delivery_date": add_days(order_date, 1),
-            "company": company,
-            "set_warehouse": darkstore_warehouse,  # Source warehouse (Darkstore)
-            "items": []
-        }
-        
-        if customer_address:
-            sales_order_data["shipping_address_name"] = customer_address
-        
-        # Only set target warehouse for internal customers
-        if is_internal:
-            sales_order_data["custom_set_target_warehouse"] = darkstore_warehouse
-        
-        sales_order = frappe.get_doc(sales_order_data)
-        
-        # Add items
-        for item_code, quantity in darkstore_data["items"].items():
-            if quantity > 0:
-                sales_order.append("items", {
-                    "item_code": item_code,
-                    "qty": quantity,
-                    "warehouse": darkstore_warehouse,
-                    "delivery_date": add_days(order_date, 1)
-                })
+        result = _create_transfer_sales_order(
+            source_warehouse, None, data["items"], order_date,
+            customer, company, is_internal, "B2B", result_type, customer_address
+        )
         
-        if not sales_order.items:
-            debug_print(f"No items to add to darkstore to client sales order for {darkstore_warehouse}")
+        if not result:
+            debug_print(f"No items to add to {label} sales order for {source_warehouse}")
             return None
-            
-        sales_order.insert()
-        sales_order.submit()
-        
-        debug_print(f"Successfully created darkstore to client sales order {sales_order.name}")
         
-        return {
-            "type": "darkstore_to_client_order",
-            "order_type": "B2B",
-            "sales_order": sales_order.name,
-            "from_warehouse": darkstore_warehouse,
-            "to_customer": customer,
-            "items_count": len(sales_order.items),
-            "total_qty": sum(item.qty for item in sales_order.items)
-        }
+        debug_print(f"Successfully created {label} sales order {result['sales_order']}")
+        return result
         
     except Exception as e:
-        error_print(f"Error creating darkstore to client sales order: {str(e)}")
+        error_print(f"Error creating {label} sales order: {str(e)}")
         log_error(
             error_category="Order Processing",
-            error_description=f"Failed to create darkstore to client sales order: {str(e)}",
+            error_description=f"Failed to create {label} sales order: {str(e)}",
             processing_stage="Sales Order Creation",
             entity_type="Sales Order",
             reference_doctype="Sales Order",
             error_severity="High",
             additional_detail={
-                "from_warehouse": darkstore_warehouse,
+                "from_warehouse": source_warehouse,
                 "to_customer": customer,
                 "order_type": "B2B",
                 "customer": customer,
@@ -2312,17 +2408,52 @@ def create_sales_order_for_darkstore_to_client(darkstore_warehouse: str, darksto
         return None
 
 
+def create_sales_order_for_dc_direct(dc_warehouse: str, dc_data: Dict, order_date: str,
+                                   customer: str, company: str, is_internal: bool) -> Optional[Dict]:
+    """
+    Create sales order for direct DC to client (B2B orders)
+    """
+    return _create_direct_sales_order(dc_warehouse, "dc", dc_data, order_date, customer, company, is_internal)
+
+
+def create_sales_order_for_plant_direct(plant_warehouse: str, plant_data: Dict, order_date: str,
+                                      customer: str, company: str, is_internal: bool) -> Optional[Dict]:
+    """
+    Create sales order for direct plant to client (B2B orders)
+    """
+    return _create_direct_sales_order(plant_warehouse, "plant", plant_data, order_date, customer, company, is_internal)
+
+
+def create_sales_order_for_darkstore_to_client(darkstore_warehouse: str, darkstore_data: Dict, order_date: str,
+                                               customer: str, company: str, is_internal: bool) -> Optional[Dict]:
+    """
+    Create sales order for Darkstore to Client (B2B orders)
+    This creates the final sales order from Darkstore directly to the B2B client
+    """
+    return _create_direct_sales_order(darkstore_warehouse, "darkstore", darkstore_data, order_date,
+                                      customer, company, is_internal)
+
+
 def get_customer_shipping_address(customer: str) -> Optional[str]:
     """
-    Get the shipping address for a customer
+    Get the shipping address for a customer.
+    Results are cached in frappe.local for the current aggregation run
+    (see aggregate_orders_and_create_sales_orders).
     """
+    address_cache = getattr(frappe.local, 'customer_shipping_address_cache', None)
+    if address_cache is not None and customer in address_cache:
+        return address_cache[customer]
+    
     try:
-        customer_doc = frappe.get_doc("Customer", customer)
-        if customer_doc.customer_primary_address:
-            return customer_doc.customer_primary_address
-        return None
-    except:
-        return None
+        # Only one field is needed, so read it instead of loading the whole Customer document
+        shipping_address = frappe.db.get_value("Customer", customer, "customer_primary_address") or None
+    except Exception:
+        shipping_address = None
+    
+    if address_cache is not None:
+        address_cache[customer] = shipping_address
+    
+    return shipping_address
 
 
 def mark_orders_and_items_as_processed(d2c_processing_results: Dict, b2b_processing_results: Dict) -> None:
@@ -2335,21 +2466,28 @@ def mark_orders_and_items_as_processed(d2c_processing_results: Dict, b2b_process
     """
     debug_print("Marking orders and items as processed")
     
-    # Check if we're already in a transaction
-    in_transaction = hasattr(frappe.db, 'transaction_writes') and frappe.db.transaction_writes > 0
     transaction_started = False
     
-    if not in_transaction:
-        # Start transaction only if not already in one
-        frappe.db.begin()
-        transaction_started = True
-    
     try:
+        # Collect the updates of both order types first, then write them in batched UPDATEs
+        processed_item_rows = []
+        orders_by_status = {"Processed": [], "Partially Processed": [], "Unprocessed": []}
+        
         # Process D2C orders
-        mark_processing_results(d2c_processing_results, "D2C")
+        mark_processing_results(d2c_processing_results, processed_item_rows, orders_by_status)
         
         # Process B2B orders
-        mark_processing_results(b2b_processing_results, "B2B")
+        mark_processing_results(b2b_processing_results, processed_item_rows, orders_by_status)
+        
+        # Check if we're already in a transaction
+        in_transaction = hasattr(frappe.db, 'transaction_writes') and frappe.db.transaction_writes > 0
+        
+        if not in_transaction:
+            # Start transaction only if not already in one; it only spans the batched UPDATEs
+            frappe.db.begin()
+            transaction_started = True
+        
+        update_processing_flags(processed_item_rows, orders_by_status)
         
         # Commit the changes only if we started the transaction
         if transaction_started:
@@ -2374,63 +2512,110 @@ def mark_orders_and_items_as_processed(d2c_processing_results: Dict, b2b_process
         )
 
 
-def mark_processing_results(processing_results: Dict, order_type: str) -> None:
+def mark_processing_results(processing_results: Dict, processed_item_rows: List[str],
+                            orders_by_status: Dict[str, List[str]]) -> None:
     """
-    Mark processing results for a specific order type
+    Collect the processed item rows and order statuses of one order type
+    
+    Args:
+        processing_results: Order processing results of process_order_items
+        processed_item_rows: SF Order Item names to mark as processed, extended in place
+        orders_by_status: processing_status -> SF Order Master names, extended in place
     """
     for order_name, item_details in processing_results["item_processing_details"].items():
-        try:
-            # Count successful and total items
-            successful_items = [details for details in item_details.values() if details["success"]]
-            total_items = len(item_details)
-            
-            # Mark individual items as processed
-            for item_id, details in item_details.items():
-                if details["success"]:
-                    # Mark item as processed
-                    frappe.db.set_value("SF Order Item", details["item_row_name"], "is_item_processed", 1)
-                    debug_print(f"Marked item {item_id} in order {order_name} as processed")
-            
-            # Determine order status
-            if len(successful_items) == 0:
-                order_status = "Unprocessed"
-            elif len(successful_items) == total_items:
-                order_status = "Processed"
-            else:
-                order_status = "Partially Processed"
-            
-            # Mark order status
-            frappe.db.set_value("SF Order Master", order_name, "processing_status", order_status)
-            debug_print(f"Marked order {order_name} as {order_status} ({len(successful_items)}/{total_items} items)")
-            
-        except Exception as e:
-            error_print(f"Error marking order {order_name} as processed: {str(e)}")
-            log_error(
-                error_category="Order Processing",
-                error_description=f"Failed to mark order {order_name} as processed: {str(e)}",
-                processing_stage="Post Processing",
-                entity_type=f"Order {order_type}",
-                reference_doctype="SF Order Master",
-                internal_reference=order_name,
-                error_severity="Medium",
-                additional_detail={
-                    "order_name": order_name,
-                    "order_type": order_type,
-                    "error": str(e)
-                }
-            )
+        # Collect the successfully processed item rows
+        successful_items = 0
+        for item_id, details in item_details.items():
+            if details["success"]:
+                successful_items += 1
+                processed_item_rows.append(details["item_row_name"])
+                if DEBUG:
+                    debug_print(f"Marking item {item_id} in order {order_name} as processed")
+        
+        total_items = len(item_details)
+        
+        # Determine order status
+        if successful_items == 0:
+            order_status = "Unprocessed"
+        elif successful_items == total_items:
+            order_status = "Processed"
+        else:
+            order_status = "Partially Processed"
+        
+        orders_by_status[order_status].append(order_name)
+        if DEBUG:
+            debug_print(f"Marking order {order_name} as {order_status} ({successful_items}/{total_items} items)")
+
+
+def update_processing_flags(processed_item_rows: List[str], orders_by_status: Dict[str, List[str]]) -> None:
+    """
+    Write the item flags and order statuses collected by mark_processing_results
+    with one UPDATE per chunk of names instead of one set_value per row
+    
+    Args:
+        processed_item_rows: SF Order Item names to mark as processed
+        orders_by_status: processing_status -> SF Order Master names
+    """
+    modified = now()
+    modified_by = frappe.session.user
+    
+    for i in range(0, len(processed_item_rows), PROCESSING_UPDATE_CHUNK_SIZE):
+        frappe.db.sql("""
+            UPDATE `tabSF Order Item`
+            SET is_item_processed = 1, modified = %(modified)s, modified_by = %(modified_by)s
+            WHERE name IN %(names)s
+            AND IFNULL(is_item_processed, 0) = 0
+        """, {
+            "modified": modified,
+            "modified_by": modified_by,
+            "names": processed_item_rows[i:i + PROCESSING_UPDATE_CHUNK_SIZE]
+        })
+    
+    for order_status, order_names in orders_by_status.items():
+        for i in range(0, len(order_names), PROCESSING_UPDATE_CHUNK_SIZE):
+            frappe.db.sql("""
+                UPDATE `tabSF Order Master`
+                SET processing_status = %(order_status)s, modified = %(modified)s, modified_by = %(modified_by)s
+                WHERE name IN %(names)s
+                AND IFNULL(processing_status, '') != %(order_status)s
+            """, {
+                "order_status": order_status,
+                "modified": modified,
+                "modified_by": modified_by,
+                "names": order_names[i:i + PROCESSING_UPDATE_CHUNK_SIZE]
+            })
+    
+    debug_print(f"Marked {len(processed_item_rows)} items and "
+                f"{sum(len(order_names) for order_names in orders_by_status.values())} orders")
 
 
 def get_internal_customer():
     """
     Get internal customer for default company
+    The result is cached in frappe.local for the current aggregation run
+    (see aggregate_orders_and_create_sales_orders).
     """
     default_company = frappe.defaults.get_defaults().get("company")
-    internal_customer = frappe.get_value("Customer", {"is_internal_customer": 1, "represents_company": default_company}, "name")
+    
+    internal_customer_cache = getattr(frappe.local, 'internal_customer_cache', None)
+    if internal_customer_cache is not None and default_company in internal_customer_cache:
+        return internal_customer_cache[default_company]
+    
+    internal_customer = frappe.db.sql("""
+        SELECT name
+        FROM `tabCustomer`
+        WHERE is_internal_customer = 1
+        AND represents_company = %(company)s
+        LIMIT 1
+    """, {"company": default_company})
+    internal_customer = internal_customer[0][0] if internal_customer else None
     
     if not internal_customer:
         frappe.throw(_("No internal customer found for company {0}").format(default_company))
     
+    if internal_customer_cache is not None:
+        internal_customer_cache[default_company] = internal_customer
+    
     return internal_customer
 
 
@@ -2462,23 +2647,27 @@ def test_aggregate_orders(branches_json: str, order_date: str) -> Dict[str, Any]
 
 
 # Scheduled job function
-def daily_order_aggregation():
+def daily_order_aggregation(branch_names: Optional[List[str]] = None, order_date: Optional[str] = None):
     """
     Daily scheduled job to aggregate orders
     This can be configured in hooks.py for automatic execution
+    
+    Args:
+        branch_names: Branches to process, all branches if not given
+                      (enqueue_daily_order_aggregation passes one shard of branches)
+        order_date: Date in YYYY-MM-DD format, today if not given
     """
     try:
         info_print("Starting daily order aggregation job")
         
-        # Get all active branches
-        branches = frappe.db.sql("""
-            SELECT name
-            FROM `tabBranch`
-        """, as_dict=True)
-        
-        branch_names = [branch.name for branch in branches]
+        if branch_names is None:
+            # Get all active branches
+            branch_names = frappe.db.sql_list("""
+                SELECT name
+                FROM `tabBranch`
+            """)
         # yesterday = add_days(nowdate(), -1) # we do not need to add -1 as we are using today's date
-        current_date = today()
+        current_date = order_date or today()
 
         # branch_names = ["Hyderabad"]
         # yesterday = "2025-08-10"
@@ -2542,4 +2731,77 @@ def daily_order_aggregation():
         }
 
 
+def enqueue_daily_order_aggregation(shard_size: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Split the branches into shards of shard_size and enqueue one daily_order_aggregation
+    job per shard on the long queue, so the shards run on separate workers (each with its
+    own database connection) and a failing shard does not stop the others
+    
+    Only the work outside the sales order transactions runs in parallel: fetching and grouping
+    orders, item and combo processing, address lookups and marking orders as processed. The
+    plant -> DC groups of all shards take the same Sales Order naming series lock until they
+    commit, so their sales orders are still created one group at a time (see
+    create_combined_sales_orders). The expected speedup is therefore that of the preparation
+    and marking work, at most the number of shards, not of the sales order inserts. A group
+    that waits longer than the database lock wait timeout fails, is rolled back and its orders
+    are retried by the next run
+    
+    Args:
+        shard_size: Number of branches aggregated by one job, the daily_order_aggregation_branch_shard_size
+                    site config or BRANCH_SHARD_SIZE if not given
+    
+    Returns:
+        Dict with the enqueued job names
+    """
+    try:
+        # The shard jobs run on other connections; commit what the caller wrote so far (e.g. the
+        # addresses, warehouses and customers of the preceding cron steps) so they can see it
+        frappe.db.commit()
+        
+        shard_size = max(cint(shard_size or frappe.conf.get("daily_order_aggregation_branch_shard_size") or BRANCH_SHARD_SIZE), 1)
+        branch_names = frappe.db.sql_list("""
+            SELECT name
+            FROM `tabBranch`
+        """)
+        current_date = today()
+        
+        job_names = []
+        skipped_job_names = []
+        for i in range(0, len(branch_names), shard_size):
+            shard = branch_names[i:i + shard_size]
+            # The job id is derived from the date and the shard's branches, so a rerun does not
+            # enqueue a second job for a shard that is still queued or running; two jobs for
+            # the same branches would create the same sales orders twice
+            job_name = f"daily_order_aggregation_{current_date}_{'_'.join(shard)}"
+            job = frappe.enqueue(
+                method="inv_mgmt.cron_functions.aggregate_order_data.daily_order_aggregation",
+                queue="long",
+                timeout=AGGREGATION_SHARD_TIMEOUT,
+                job_name=job_name,
+                job_id=job_name,
+                deduplicate=True,
+                is_async=True,
+                branch_names=shard,
+                order_date=current_date
+            )
+            if job:
+                job_names.append(job_name)
+            else:
+                skipped_job_names.append(job_name)
+        
+        info_print(f"Enqueued {len(job_names)} daily order aggregation jobs for {len(branch_names)} branches")
+        if skipped_job_names:
+            info_print(f"Skipped {len(skipped_job_names)} shards that are already queued or running")
+        
+        return {
+            "status": "success",
+            "message": f"Enqueued {len(job_names)} jobs",
+            "jobs": job_names,
+            "skipped_jobs": skipped_job_names
+        }
+    except Exception as e:
+        error_print(f"Error enqueueing daily order aggregation jobs: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
+
 # bench execute "inv_mgmt.cron_functions.aggregate_order_data.daily_order_aggregation"
\ No newline at end of file
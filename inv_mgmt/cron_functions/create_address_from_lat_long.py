@@ -1,12 +1,54 @@
 import frappe
+import logging
 import requests
 import time
+from collections import OrderedDict
 from typing import Dict, Any, List, Optional
 from frappe.utils import cstr
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# orjson ships with Frappe; fall back to requests' own JSON decoding if it is missing
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Rate limit for Nominatim API - 1 request per second
 NOMINATIM_API_DELAY_SECONDS = 1
 
+# Redis key held for NOMINATIM_API_DELAY_SECONDS after every API call. It is shared by all
+# sites and workers of the bench (they call Nominatim from the same IP address)
+NOMINATIM_RATE_LIMIT_KEY = "inv_mgmt:nominatim_rate_limit"
+
+# Redis hash of successful reverse geocode results, keyed by coordinates rounded to 5 decimals (~1 m)
+NOMINATIM_CACHE_KEY = "nominatim_reverse_geocode"
+
+# In-process copy of recent reverse geocode results (same keys as NOMINATIM_CACHE_KEY), so a
+# worker running both address jobs does not go to Redis again for coordinates it already has.
+# Results depend only on the coordinates, so it is safe to share between sites
+NOMINATIM_MEMORY_CACHE_SIZE = 10000
+nominatim_memory_cache = OrderedDict()
+
+def get_logger():
+    """
+    Logger of the address creation jobs (per site, cached by frappe.logger). Messages use
+    lazy % formatting, so debug messages cost nothing unless debug logging is enabled.
+    """
+    return frappe.logger("addr_creation", allow_site=True)
+
+# Shared HTTP session for Nominatim API calls - keeps the connection alive between requests
+# instead of a new TCP + TLS handshake per facility, and backs off on rate limiting / server errors
+nominatim_session = requests.Session()
+nominatim_session.headers.update({
+    'User-Agent': 'SidFarmERP/1.0 (contact@sidfarm.com)'  # Required by Nominatim usage policy
+})
+nominatim_session.mount("https://", HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=1,
+    max_retries=Retry(total=3, backoff_factor=1, status_forcelist=[429, 502, 503, 504])
+))
+
 def create_address_from_lat_long_for_sf_facility_master():
     """
     Main cron function to create Address records for SF Facility Master documents 
@@ -17,23 +59,31 @@ def create_address_from_lat_long_for_sf_facility_master():
     2. For each facility, call Nominatim API to get address details
     3. Create Address record with proper naming and linking
     4. Update SF Facility Master with the new shipping_address
-    5. Respects 1 second rate limit between API calls
+    5. Respects 1 second rate limit between API calls (see wait_for_nominatim_slot)
+    
+    Every Address needs a street level address_line1, which only Nominatim provides
+    (an offline city/state reverse geocoder or a pincode -> city/state table is not
+    enough, and create_warehouse_for_facility copies address_line1 to the warehouse too),
+    so coordinates that were looked up before are served from the reverse geocode cache
+    instead (see get_address_from_nominatim).
     """
+    logger = get_logger()
+    
     try:
-        print("Starting address creation from latitude/longitude process...")
+        logger.info("Starting address creation from latitude/longitude process...")
         
         # Get SF Facility Master records that need address creation
         facilities = get_facilities_needing_addresses()
         
         if not facilities:
-            print("No facilities found that need address creation")
+            logger.info("No facilities found that need address creation")
             return {
                 "success": True,
                 "message": "No facilities found that need address creation",
                 "processed": 0
             }
         
-        print(f"Found {len(facilities)} facilities that need address creation")
+        logger.info("Found %s facilities that need address creation", len(facilities))
         
         success_count = 0
         error_count = 0
@@ -41,10 +91,13 @@ def create_address_from_lat_long_for_sf_facility_master():
         
         for facility in facilities:
             try:
-                print(f"Processing facility: {facility.name} - {facility.facility_name}")
+                logger.debug("Processing facility: %s - %s", facility.name, facility.facility_name)
                 
-                # Get address data from Nominatim API
-                address_data = get_address_from_nominatim(facility.latitude, facility.longitude)
+                # Get address data from the reverse geocode cache, or else from Nominatim API
+                address_data = get_cached_nominatim_address(facility.latitude, facility.longitude)
+                if address_data is None:
+                    # Rate limited in get_address_from_nominatim (see wait_for_nominatim_slot)
+                    address_data = get_address_from_nominatim(facility.latitude, facility.longitude, check_cache=False)
                 
                 if address_data:
                     # Create Address record
@@ -54,7 +107,7 @@ def create_address_from_lat_long_for_sf_facility_master():
                         # Update SF Facility Master with shipping address
                         update_facility_shipping_address(facility.name, address_name)
                         success_count += 1
-                        print(f"Successfully created address for facility: {facility.name}")
+                        logger.debug("Successfully created address for facility: %s", facility.name)
                     else:
                         error_count += 1
                         errors.append({
@@ -91,11 +144,7 @@ def create_address_from_lat_long_for_sf_facility_master():
                         error_description="Failed to get address data from Nominatim API",
                         additional_detail={"facility": facility}
                     )
-                
-                # Rate limiting - wait 1 second between API calls
-                if len(facilities) > 1:  # Only wait if there are more facilities to process
-                    print(f"Waiting {NOMINATIM_API_DELAY_SECONDS} seconds before next API call...")
-                    time.sleep(NOMINATIM_API_DELAY_SECONDS)
+
                 
             except Exception as e:
                 error_count += 1
@@ -105,7 +154,7 @@ def create_address_from_lat_long_for_sf_facility_master():
                 }
                 errors.append(error_detail)
                 
-                print(f"Error processing facility {facility.name}: {str(e)}")
+                logger.error("Error processing facility %s: %s", facility.name, e)
                 frappe.log_error(
                     title=f"Address Creation Error - {facility.name}",
                     message=f"Error: {str(e)}\nFacility Data: {facility}"
@@ -123,7 +172,7 @@ def create_address_from_lat_long_for_sf_facility_master():
                     additional_detail={"facility": facility}
                 )
         
-        print(f"Address creation completed. Success: {success_count}, Errors: {error_count}")
+        logger.info("Address creation completed. Success: %s, Errors: %s", success_count, error_count)
         
         return {
             "success": True,
@@ -133,7 +182,7 @@ def create_address_from_lat_long_for_sf_facility_master():
         }
         
     except Exception as e:
-        print(f"Critical error during address creation: {str(e)}")
+        logger.error("Critical error during address creation: %s", e)
         frappe.log_error(
             title="Address Creation from Lat/Long - Critical Error",
             message=f"Error: {str(e)}\nTraceback: {frappe.get_traceback()}"
@@ -149,9 +198,16 @@ def get_facilities_needing_addresses() -> List[Dict[str, Any]]:
     Get SF Facility Master records that don't have shipping_address set 
     but have latitude and longitude coordinates.
     
+    The range check stays in Python: latitude and longitude are Data fields, so a
+    "between" filter would compare strings, and facilities with invalid coordinates
+    must still reach the loop below to be logged as Invalid Coordinates errors.
+    The "is set" filters already drop empty coordinates in the query.
+    
     Returns:
         List of facility dictionaries with required fields
     """
+    logger = get_logger()
+    
     try:
         facilities = frappe.get_all(
             "SF Facility Master",
@@ -164,36 +220,19 @@ def get_facilities_needing_addresses() -> List[Dict[str, Any]]:
             order_by="creation asc"
         )
         
-        # Filter out facilities with empty/null or invalid coordinates
+        # Filter out facilities with blank or invalid coordinates. float() goes first: blank
+        # values are only told apart from non-numeric ones on the (rare) error path
         valid_facilities = []
         for facility in facilities:
-            if (facility.latitude and facility.longitude and 
-                str(facility.latitude).strip() and str(facility.longitude).strip()):
+            try:
+                lat = float(facility.latitude)
+                lon = float(facility.longitude)
                 
-                try:
-                    lat = float(facility.latitude)
-                    lon = float(facility.longitude)
-                    
-                    # Validate coordinate ranges and check for invalid values
-                    if (is_valid_coordinates(lat, lon)):
-                        valid_facilities.append(facility)
-                    else:
-                        print(f"Skipping facility {facility.name} due to invalid coordinates: {lat}, {lon}")
-                        log_inventory_import_error(
-                            reference_doctype="SF Facility Master",
-                            internal_reference=facility.name,
-                            source_system="Internal Processing",
-                            external_id="",
-                            entity_type="Facility",
-                            error_category="Invalid Coordinates",
-                            error_severity="High",
-                            processing_stage="Address Generation",
-                            error_description=f"Invalid coordinates: {lat}, {lon}",
-                            additional_detail={"facility": facility}
-                        )
-                        
-                except (ValueError, TypeError):
-                    print(f"Skipping facility {facility.name} due to non-numeric coordinates: {facility.latitude}, {facility.longitude}")
+                # Validate coordinate ranges and check for invalid values
+                if (is_valid_coordinates(lat, lon)):
+                    valid_facilities.append(facility)
+                else:
+                    logger.warning("Skipping facility %s due to invalid coordinates: %s, %s", facility.name, lat, lon)
                     log_inventory_import_error(
                         reference_doctype="SF Facility Master",
                         internal_reference=facility.name,
@@ -203,9 +242,28 @@ def get_facilities_needing_addresses() -> List[Dict[str, Any]]:
                         error_category="Invalid Coordinates",
                         error_severity="High",
                         processing_stage="Address Generation",
-                        error_description=f"Non-numeric coordinates: {facility.latitude}, {facility.longitude}",
+                        error_description=f"Invalid coordinates: {lat}, {lon}",
                         additional_detail={"facility": facility}
                     )
+                    
+            except (ValueError, TypeError):
+                # Blank (whitespace only) coordinates are skipped without an error
+                if not str(facility.latitude).strip() or not str(facility.longitude).strip():
+                    continue
+                
+                logger.warning("Skipping facility %s due to non-numeric coordinates: %s, %s", facility.name, facility.latitude, facility.longitude)
+                log_inventory_import_error(
+                    reference_doctype="SF Facility Master",
+                    internal_reference=facility.name,
+                    source_system="Internal Processing",
+                    external_id="",
+                    entity_type="Facility",
+                    error_category="Invalid Coordinates",
+                    error_severity="High",
+                    processing_stage="Address Generation",
+                    error_description=f"Non-numeric coordinates: {facility.latitude}, {facility.longitude}",
+                    additional_detail={"facility": facility}
+                )
         
         return valid_facilities
         
@@ -217,6 +275,12 @@ def get_facilities_needing_addresses() -> List[Dict[str, Any]]:
         return []
 
 
+# Common invalid placeholder values for coordinates
+INVALID_COORDINATES = frozenset({
+    (0, 0), (1, 1), (-1, -1), (90, 90), (-90, -90),
+    (180, 180), (-180, -180)
+})
+
 def is_valid_coordinates(lat: float, lon: float) -> bool:
     """
     Validate if latitude and longitude coordinates are reasonable.
@@ -228,10 +292,11 @@ def is_valid_coordinates(lat: float, lon: float) -> bool:
     Returns:
         True if coordinates are valid, False otherwise
     """
-    # Basic range validation
-    if not (-90 <= lat <= 90):
-        return False
-    if not (-180 <= lon <= 180):
+    # Check if coordinates are within reasonable bounds for India (assuming this is for Indian facilities)
+    # India roughly: Lat 6.75° to 37.08°, Lon 68.03° to 97.39°
+    # Adding some buffer for nearby regions
+    # (this also covers the basic -90..90 / -180..180 range validation)
+    if not (5 <= lat <= 40 and 65 <= lon <= 100):
         return False
     
     # Check for obviously invalid coordinates
@@ -239,70 +304,145 @@ def is_valid_coordinates(lat: float, lon: float) -> bool:
         return False
     
     # Check for common invalid placeholder values
-    invalid_coords = [
-        (0, 0), (1, 1), (-1, -1), (90, 90), (-90, -90),
-        (180, 180), (-180, -180)
-    ]
-    
-    if (lat, lon) in invalid_coords:
-        return False
-    
-    # Check if coordinates are within reasonable bounds for India (assuming this is for Indian facilities)
-    # India roughly: Lat 6.75° to 37.08°, Lon 68.03° to 97.39°
-    # Adding some buffer for nearby regions
-    if not (5 <= lat <= 40):
-        return False
-    if not (65 <= lon <= 100):
+    if (lat, lon) in INVALID_COORDINATES:
         return False
     
     return True
 
 
-def get_address_from_nominatim(latitude: str, longitude: str) -> Optional[Dict[str, Any]]:
+def get_nominatim_cache_key(latitude: str, longitude: str) -> Optional[str]:
+    """
+    Build the reverse geocode cache key for coordinates, rounded to 5 decimals.
+    
+    Returns:
+        Cache key, or None for non-numeric coordinates
+    """
+    try:
+        return f"{round(float(latitude), 5)}:{round(float(longitude), 5)}"
+    except (ValueError, TypeError):
+        return None
+
+
+def get_cached_nominatim_address(latitude: str, longitude: str) -> Optional[Dict[str, Any]]:
+    """
+    Get a previously retrieved Nominatim result for the coordinates from the cache.
+    
+    Args:
+        latitude: Latitude coordinate as string
+        longitude: Longitude coordinate as string
+    
+    Returns:
+        Cached Nominatim response or None if the coordinates were not looked up before
+    """
+    cache_key = get_nominatim_cache_key(latitude, longitude)
+    if not cache_key:
+        return None
+    
+    if cache_key in nominatim_memory_cache:
+        nominatim_memory_cache.move_to_end(cache_key)
+        return nominatim_memory_cache[cache_key]
+    
+    try:
+        address_data = frappe.cache().hget(NOMINATIM_CACHE_KEY, cache_key)
+        if address_data:
+            remember_nominatim_address(cache_key, address_data)
+        return address_data
+    except Exception as e:
+        get_logger().warning("Error reading reverse geocode cache for coordinates %s, %s: %s", latitude, longitude, e)
+        return None
+
+
+def remember_nominatim_address(cache_key: str, address_data: Dict[str, Any]):
+    """Keep a reverse geocode result in the in-process cache, dropping the least recently used."""
+    nominatim_memory_cache[cache_key] = address_data
+    nominatim_memory_cache.move_to_end(cache_key)
+    if len(nominatim_memory_cache) > NOMINATIM_MEMORY_CACHE_SIZE:
+        nominatim_memory_cache.popitem(last=False)
+
+
+def wait_for_nominatim_slot():
+    """
+    Block until a Nominatim API call is allowed. Calls are spaced NOMINATIM_API_DELAY_SECONDS
+    apart across every worker (facility and customer address jobs, test endpoints), so only
+    the calls themselves wait, not cache hits or the record creation in between.
+    """
+    while True:
+        try:
+            if frappe.cache().set(NOMINATIM_RATE_LIMIT_KEY, 1, nx=True, px=int(NOMINATIM_API_DELAY_SECONDS * 1000)):
+                return
+        except Exception as e:
+            # Without Redis, fall back to a plain wait
+            get_logger().warning("Nominatim rate limiter unavailable, waiting %s seconds: %s", NOMINATIM_API_DELAY_SECONDS, e)
+            time.sleep(NOMINATIM_API_DELAY_SECONDS)
+            return
+        
+        time.sleep(0.1)
+
+
+def get_address_from_nominatim(latitude: str, longitude: str, check_cache: bool = True) -> Optional[Dict[str, Any]]:
     """
     Call Nominatim API to get address details from latitude and longitude.
+    Successful results are cached by rounded coordinates, so coordinates that were
+    looked up before do not use up the API rate limit again.
     
     Args:
         latitude: Latitude coordinate as string
         longitude: Longitude coordinate as string
+        check_cache: Whether to return a cached result if there is one
+                     (False when the caller already checked the cache)
     
     Returns:
         Dictionary containing address details or None if failed
     """
+    logger = get_logger()
+    
     try:
         # Clean and validate coordinates
         lat = str(latitude).strip()
         lon = str(longitude).strip()
         
         if not lat or not lon:
-            print(f"Invalid coordinates: lat={lat}, lon={lon}")
+            logger.warning("Invalid coordinates: lat=%s, lon=%s", lat, lon)
             return None
         
+        if check_cache:
+            cached_data = get_cached_nominatim_address(lat, lon)
+            if cached_data:
+                logger.debug("Using cached address data for coordinates: %s, %s", lat, lon)
+                return cached_data
+        
         # Construct API URL
         api_url = f"https://nominatim.openstreetmap.org/reverse?format=json&lat={lat}&lon={lon}&zoom=18&addressdetails=1"
         
-        print(f"Calling Nominatim API: {api_url}")
-        
-        # Make API request with proper headers
-        headers = {
-            'User-Agent': 'SidFarmERP/1.0 (contact@sidfarm.com)'  # Required by Nominatim usage policy
-        }
+        logger.debug("Calling Nominatim API: %s", api_url)
         
-        response = requests.get(api_url, headers=headers, timeout=30)
+        # Make API request on the shared session (sends the User-Agent header)
+        wait_for_nominatim_slot()
+        response = nominatim_session.get(api_url, timeout=30)
         response.raise_for_status()
         
-        api_data = response.json()
+        # Parse the raw bytes directly instead of decoding them to text first
+        api_data = orjson.loads(response.content) if orjson else response.json()
         
         # Check if we got valid address data
         if not api_data or 'error' in api_data:
-            print(f"No valid address data for coordinates: {lat}, {lon}")
+            logger.warning("No valid address data for coordinates: %s, %s", lat, lon)
             return None
         
-        print(f"Successfully retrieved address data for coordinates: {lat}, {lon}")
+        logger.debug("Successfully retrieved address data for coordinates: %s, %s", lat, lon)
+        
+        cache_key = get_nominatim_cache_key(lat, lon)
+        if cache_key:
+            remember_nominatim_address(cache_key, api_data)
+            try:
+                frappe.cache().hset(NOMINATIM_CACHE_KEY, cache_key, api_data)
+            except Exception as e:
+                logger.warning("Error caching address data for coordinates %s, %s: %s", lat, lon, e)
+        
         return api_data
         
     except requests.RequestException as e:
-        print(f"API request error for coordinates {latitude}, {longitude}: {str(e)}")
+        logger.error("API request error for coordinates %s, %s: %s", latitude, longitude, e)
         frappe.log_error(
             title="Nominatim API Request Error",
             message=f"Error: {str(e)}\nCoordinates: {latitude}, {longitude}"
@@ -321,7 +461,7 @@ def get_address_from_nominatim(latitude: str, longitude: str) -> Optional[Dict[s
         )
         return None
     except Exception as e:
-        print(f"Error getting address from Nominatim: {str(e)}")
+        logger.error("Error getting address from Nominatim: %s", e)
         frappe.log_error(
             title="Nominatim Address Extraction Error",
             message=f"Error: {str(e)}\nCoordinates: {latitude}, {longitude}"
@@ -352,31 +492,32 @@ def create_address_record(facility: Dict[str, Any], address_data: Dict[str, Any]
     Returns:
         Address record name if successful, None otherwise
     """
+    logger = get_logger()
+    
     try:
         # Extract address components from Nominatim response
         address_components = address_data.get("address", {})
         
         # Map Nominatim fields to Address fields
-        address_line1 = get_address_line1(address_components)
-        address_line2 = get_address_line2(address_components)
-        city = get_city(address_components)
-        state = get_state(address_components)
-        country = get_country(address_components)
-        pincode = get_pincode(address_components)
+        parsed_address = parse_address(address_components)
+        address_line1 = parsed_address["address_line1"]
+        address_line2 = parsed_address["address_line2"]
+        city = parsed_address["city"]
+        state = parsed_address["state"]
+        country = parsed_address["country"]
+        pincode = parsed_address["pincode"]
         
         # Log what we found for debugging
-        print(f"Address components for {facility.name}:")
-        print(f"  Address Line 1: {address_line1}")
-        print(f"  Address Line 2: {address_line2}")
-        print(f"  City: {city}")
-        print(f"  State: {state}")
-        print(f"  Country: {country}")
-        print(f"  Pincode: {pincode}")
+        logger.debug(
+            "Address components for %s: Address Line 1: %s, Address Line 2: %s, City: %s, State: %s, Country: %s, Pincode: %s",
+            facility.name, address_line1, address_line2, city, state, country, pincode
+        )
         
         # Validate required fields
         if not address_line1 or address_line1 == "Location not specified":
-            print(f"No valid address line 1 found for facility {facility.name}")
-            print(f"Available address components: {list(address_components.keys())}")
+            logger.warning("No valid address line 1 found for facility %s", facility.name)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Available address components: %s", list(address_components.keys()))
             log_inventory_import_error(
                 reference_doctype="SF Facility Master",
                 internal_reference=facility.name,
@@ -392,8 +533,9 @@ def create_address_record(facility: Dict[str, Any], address_data: Dict[str, Any]
             return None
         
         if not city or city == "Unknown City":
-            print(f"No valid city found for facility {facility.name}")
-            print(f"Available address components: {list(address_components.keys())}")
+            logger.warning("No valid city found for facility %s", facility.name)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Available address components: %s", list(address_components.keys()))
             log_inventory_import_error(
                 reference_doctype="SF Facility Master",
                 internal_reference=facility.name,
@@ -409,8 +551,9 @@ def create_address_record(facility: Dict[str, Any], address_data: Dict[str, Any]
             return None
         
         if not country:
-            print(f"No valid country found for facility {facility.name}")
-            print(f"Available address components: {list(address_components.keys())}")
+            logger.warning("No valid country found for facility %s", facility.name)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Available address components: %s", list(address_components.keys()))
             log_inventory_import_error(
                 reference_doctype="SF Facility Master",
                 internal_reference=facility.name,
@@ -456,11 +599,11 @@ def create_address_record(facility: Dict[str, Any], address_data: Dict[str, Any]
         # Insert the address record
         address_doc.insert()
         
-        print(f"Created address record: {address_doc.name} for facility: {facility.name}")
+        logger.debug("Created address record: %s for facility: %s", address_doc.name, facility.name)
         return address_doc.name
         
     except Exception as e:
-        print(f"Error creating address record for facility {facility.name}: {str(e)}")
+        logger.error("Error creating address record for facility %s: %s", facility.name, e)
         frappe.log_error(
             title=f"Address Record Creation Error - {facility.name}",
             message=f"Error: {str(e)}\nFacility: {facility}\nAddress Data: {address_data}"
@@ -492,15 +635,14 @@ def update_facility_shipping_address(facility_name: str, address_name: str) -> b
         True if successful, False otherwise
     """
     try:
-        facility_doc = frappe.get_doc("SF Facility Master", facility_name)
-        facility_doc.shipping_address = address_name
-        facility_doc.save()
+        # Direct update of the one field instead of loading and saving the whole document
+        frappe.db.set_value("SF Facility Master", facility_name, "shipping_address", address_name)
         
-        print(f"Updated facility {facility_name} with shipping address {address_name}")
+        get_logger().debug("Updated facility %s with shipping address %s", facility_name, address_name)
         return True
         
     except Exception as e:
-        print(f"Error updating facility {facility_name} with shipping address: {str(e)}")
+        get_logger().error("Error updating facility %s with shipping address: %s", facility_name, e)
         frappe.log_error(
             title=f"Facility Update Error - {facility_name}",
             message=f"Error: {str(e)}\nAddress: {address_name}"
@@ -508,23 +650,52 @@ def update_facility_shipping_address(facility_name: str, address_name: str) -> b
         return False
 
 
-def get_address_line1(address_components: Dict[str, Any]) -> str:
-    """Extract primary address line from Nominatim address components."""
-    # Priority order for address line 1 - start with most specific
-    street_fields = [
-        "house_number", "building", "shop", "office", 
-        "road", "pedestrian", "footway", "cycleway"
-    ]
-    
-    area_fields = [
-        "neighbourhood", "suburb", "district", "village", "hamlet",
-        "city_district", "municipality", "town", "city"
-    ]
+# Nominatim address component priorities, most specific first
+ADDRESS_STREET_FIELDS = ("road", "pedestrian", "footway", "cycleway")
+ADDRESS_AREA_FIELDS = (
+    "neighbourhood", "suburb", "district", "village", "hamlet",
+    "city_district", "municipality", "town", "city"
+)
+ADDRESS_ADMIN_FIELDS = ("county", "state_district")
+ADDRESS_LINE2_FIELDS = (
+    "neighbourhood", "suburb", "village", "hamlet",
+    "city_district", "municipality"
+)
+ADDRESS_CITY_FIELDS = (
+    "city", "town", "municipality", "city_district",
+    "county", "state_district", "district"
+)
+
+
+def get_first_component(address_components: Dict[str, Any], fields: tuple) -> Optional[str]:
+    """Return the first non-empty address component of the given fields."""
+    return next((address_components[field] for field in fields if address_components.get(field)), None)
+
+
+def parse_address(address_components: Dict[str, Any]) -> Dict[str, Optional[str]]:
+    """
+    Map Nominatim address components to Address fields in one call.
     
-    admin_fields = [
-        "county", "state_district"
-    ]
+    Args:
+        address_components: "address" dict of a Nominatim response
     
+    Returns:
+        Dict with address_line1, address_line2, city, state, country and pincode
+    """
+    # City falls back to the state
+    state = address_components.get("state")
+    return {
+        "address_line1": get_address_line1(address_components),
+        "address_line2": get_first_component(address_components, ADDRESS_LINE2_FIELDS),
+        "city": get_first_component(address_components, ADDRESS_CITY_FIELDS) or state or "Unknown City",
+        "state": state,
+        "country": address_components.get("country", "India"),
+        "pincode": address_components.get("postcode")
+    }
+
+
+def get_address_line1(address_components: Dict[str, Any]) -> str:
+    """Extract primary address line from Nominatim address components."""
     parts = []
     
     # Add house number first if available
@@ -532,24 +703,21 @@ def get_address_line1(address_components: Dict[str, Any]) -> str:
         parts.append(address_components["house_number"])
     
     # Add road/street name
-    for field in ["road", "pedestrian", "footway", "cycleway"]:
-        if address_components.get(field):
-            parts.append(address_components[field])
-            break
+    street = get_first_component(address_components, ADDRESS_STREET_FIELDS)
+    if street:
+        parts.append(street)
     
     # If no street-level data, try area-level identifiers
     if len(parts) <= 1:  # Only house number or nothing
-        for field in area_fields:
-            if address_components.get(field):
-                parts.append(address_components[field])
-                break
+        area = get_first_component(address_components, ADDRESS_AREA_FIELDS)
+        if area:
+            parts.append(area)
     
     # If still no useful data, try administrative divisions
     if len(parts) == 0:
-        for field in admin_fields:
-            if address_components.get(field):
-                parts.append(address_components[field])
-                break
+        admin_area = get_first_component(address_components, ADDRESS_ADMIN_FIELDS)
+        if admin_area:
+            parts.append(admin_area)
     
     # Last resort: use display name or a fallback
     if len(parts) == 0:
@@ -568,55 +736,6 @@ def get_address_line1(address_components: Dict[str, Any]) -> str:
     return ", ".join(parts)
 
 
-def get_address_line2(address_components: Dict[str, Any]) -> Optional[str]:
-    """Extract secondary address line from Nominatim address components."""
-    # Secondary address components - look for area that wasn't used in line1
-    fields_to_try = [
-        "neighbourhood", "suburb", "village", "hamlet", 
-        "city_district", "municipality"
-    ]
-    
-    for field in fields_to_try:
-        if address_components.get(field):
-            return address_components[field]
-    
-    return None
-
-
-def get_city(address_components: Dict[str, Any]) -> str:
-    """Extract city from Nominatim address components."""
-    # Priority order for city
-    fields_to_try = [
-        "city", "town", "municipality", "city_district",
-        "county", "state_district", "district"
-    ]
-    
-    for field in fields_to_try:
-        if address_components.get(field):
-            return address_components[field]
-    
-    # If no city found, use state as fallback
-    if address_components.get("state"):
-        return address_components["state"]
-    
-    return "Unknown City"
-
-
-def get_state(address_components: Dict[str, Any]) -> Optional[str]:
-    """Extract state from Nominatim address components."""
-    return address_components.get("state")
-
-
-def get_country(address_components: Dict[str, Any]) -> str:
-    """Extract country from Nominatim address components."""
-    return address_components.get("country", "India")  # Default to India
-
-
-def get_pincode(address_components: Dict[str, Any]) -> Optional[str]:
-    """Extract postal code from Nominatim address components."""
-    return address_components.get("postcode")
-
-
 # Utility function for manual testing
 @frappe.whitelist()
 def test_address_creation_for_facility(facility_name: str) -> Dict[str, Any]:
@@ -675,12 +794,7 @@ def test_address_creation_for_facility(facility_name: str) -> Dict[str, Any]:
             "proposed_address": {
                 "address_title": facility.name,
                 "address_type": "Shipping",
-                "address_line1": get_address_line1(address_components),
-                "address_line2": get_address_line2(address_components),
-                "city": get_city(address_components),
-                "state": get_state(address_components),
-                "country": get_country(address_components),
-                "pincode": get_pincode(address_components)
+                **parse_address(address_components)
             },
             "raw_nominatim_data": address_data
         }
@@ -744,14 +858,7 @@ def test_coordinates_parsing(latitude: str, longitude: str) -> Dict[str, Any]:
             "success": True,
             "message": "Address data retrieved and parsed successfully",
             "coordinates": f"{latitude}, {longitude}",
-            "parsed_address": {
-                "address_line1": get_address_line1(address_components),
-                "address_line2": get_address_line2(address_components),
-                "city": get_city(address_components),
-                "state": get_state(address_components),
-                "country": get_country(address_components),
-                "pincode": get_pincode(address_components)
-            },
+            "parsed_address": parse_address(address_components),
             "raw_address_components": address_components,
             "full_nominatim_response": address_data
         }
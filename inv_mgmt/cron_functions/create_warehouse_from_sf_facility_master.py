@@ -1,62 +1,150 @@
 import frappe
 from frappe import _
 import json
-from frappe.utils import today
+from frappe.utils import today, now
+from inv_mgmt.custom_inventory_management.doctype.sf_inventory_data_import_error_logs.sf_inventory_data_import_error_logs import (
+    buffer_error_log, flush_error_logs, insert_error_logs, start_error_log_buffer
+)
 
 # Constants
 PARENT_WAREHOUSE = "Darkstore - SFPL"
 WAREHOUSE_TYPE = "Transit"
 WAREHOUSE_CATEGORY = "Darkstore"
 
+# Business rules for the branch of a state and the warehouse name suffix of a branch
+STATE_TO_BRANCH_MAPPING = {
+    "Telangana": "Hyderabad",
+    "Karnataka": "Bengaluru"
+}
+BRANCH_SUFFIX_MAPPING = {
+    "Hyderabad": "HYD",
+    "Bengaluru": "BLR"
+}
+
+# Address fields copied to the warehouse
+ADDRESS_FIELDS = ["name", "state", "address_line1", "address_line2", "city", "pincode", "phone", "email_id"]
+
+
 def get_branch_from_state(state):
     """
     Maps state to branch based on business rules.
     Returns None if state is not mapped to avoid creating warehouses for unmapped states.
     """
-    state_to_branch_mapping = {
-        "Telangana": "Hyderabad",
-        "Karnataka": "Bengaluru"
-    }
-    return state_to_branch_mapping.get(state)
+    return STATE_TO_BRANCH_MAPPING.get(state)
 
 def get_branch_suffix(branch):
     """
     Returns the appropriate suffix for warehouse name based on branch
     """
-    branch_suffix_mapping = {
-        "Hyderabad": "HYD",
-        "Bengaluru": "BLR"
+    return BRANCH_SUFFIX_MAPPING.get(branch)
+
+def get_warehouse_name(facility, branch):
+    """
+    Returns the warehouse_name of a facility's warehouse in the given branch
+    """
+    return f"{facility.facility_name}-{get_branch_suffix(branch)}"
+
+def get_existing_warehouses(warehouse_names, company):
+    """
+    Gets which of the given warehouse names already exist in the company, and the SF Facility
+    Master each of those warehouses is assigned to, with two queries
+    Returns a dict of warehouse_name -> row with the warehouse name and facility (or None)
+    """
+    if not warehouse_names:
+        return {}
+    
+    warehouses = frappe.get_all(
+        "Warehouse",
+        filters={"warehouse_name": ["in", list(warehouse_names)], "company": company},
+        fields=["name", "warehouse_name"]
+    )
+    if not warehouses:
+        return {}
+    
+    facilities = dict(frappe.get_all(
+        "SF Facility Master",
+        filters={"warehouse": ["in", [warehouse.name for warehouse in warehouses]]},
+        fields=["warehouse", "name"],
+        as_list=True
+    ))
+    return {
+        warehouse.warehouse_name: frappe._dict(name=warehouse.name, facility=facilities.get(warehouse.name))
+        for warehouse in warehouses
     }
-    return branch_suffix_mapping.get(branch)
 
-def get_state_from_address(address_name):
+def get_addresses(address_names):
     """
-    Get state from address doctype
+    Gets the ADDRESS_FIELDS of several addresses with one query
+    Returns a dict of address name -> address row
     """
-    if not address_name:
-        return None
-        
-    address = frappe.get_doc("Address", address_name)
-    return address.state
+    if not address_names:
+        return {}
+    
+    addresses = frappe.get_all(
+        "Address",
+        filters={"name": ["in", list(address_names)]},
+        fields=ADDRESS_FIELDS
+    )
+    return {address.name: address for address in addresses}
 
 def link_address_to_warehouse(warehouse_name, address_name):
     """
     Links an address to a warehouse using dynamic link
+    The link row is checked and inserted on its own instead of loading and saving the whole Address
     """
-    address = frappe.get_doc("Address", address_name)
+    link = {
+        "parent": address_name,
+        "parenttype": "Address",
+        "parentfield": "links",
+        "link_doctype": "Warehouse",
+        "link_name": warehouse_name
+    }
+    if frappe.db.exists("Dynamic Link", link):
+        return
     
-    # Check if link already exists
-    existing_link = next(
-        (link for link in address.links if link.link_doctype == "Warehouse" and link.link_name == warehouse_name),
-        None
+    # Append after the address's existing links
+    link["idx"] = (frappe.db.count("Dynamic Link", {"parent": address_name, "parenttype": "Address"}) or 0) + 1
+    frappe.get_doc({"doctype": "Dynamic Link", **link}).insert(ignore_permissions=True)
+
+def link_addresses_to_warehouses(address_links):
+    """
+    Links several addresses to their warehouses with one existence query and one INSERT
+    address_links: list of (address name, warehouse name)
+    """
+    if not address_links:
+        return
+    
+    address_names = list({address_name for address_name, _warehouse in address_links})
+    existing_links = frappe.get_all(
+        "Dynamic Link",
+        filters={"parenttype": "Address", "parent": ["in", address_names]},
+        fields=["parent", "link_doctype", "link_name", "idx"]
     )
+    linked = {(link.parent, link.link_name) for link in existing_links if link.link_doctype == "Warehouse"}
+    last_idx = {}
+    for link in existing_links:
+        last_idx[link.parent] = max(last_idx.get(link.parent, 0), link.idx or 0)
     
-    if not existing_link:
-        address.append("links", {
-            "link_doctype": "Warehouse",
-            "link_name": warehouse_name
-        })
-        address.save()
+    timestamp = now()
+    user = frappe.session.user
+    values = []
+    for address_name, warehouse_name in address_links:
+        if (address_name, warehouse_name) in linked:
+            continue
+        linked.add((address_name, warehouse_name))
+        last_idx[address_name] = last_idx.get(address_name, 0) + 1
+        values.append((
+            frappe.generate_hash(length=10), timestamp, timestamp, user, user, 0, last_idx[address_name],
+            address_name, "Address", "links", "Warehouse", warehouse_name
+        ))
+    
+    if values:
+        frappe.db.bulk_insert(
+            "Dynamic Link",
+            fields=["name", "creation", "modified", "owner", "modified_by", "docstatus", "idx",
+                    "parent", "parenttype", "parentfield", "link_doctype", "link_name"],
+            values=values
+        )
 
 def create_error_log(reference_doctype=None, internal_reference=None, source_system=None, 
                      external_id=None, entity_type=None, error_category=None, 
@@ -64,28 +152,45 @@ def create_error_log(reference_doctype=None, internal_reference=None, source_sys
                      additional_detail=None):
     """
     Create an error log entry in SF Inventory Data Import Error Logs
+    While process_darkstore_facilities runs, the entry is buffered and written with the
+    others of the run in one multi-row INSERT by flush_error_logs (see sf_inventory_data_import_error_logs)
     """
     try:
-        error_log = frappe.new_doc("SF Inventory Data Import Error Logs")
-        error_log.error_date = today()
-        error_log.reference_doctype = reference_doctype
-        error_log.internal_reference = internal_reference
-        error_log.source_system = source_system
-        error_log.external_id = external_id
-        error_log.entity_type = entity_type
-        error_log.error_category = error_category
-        error_log.error_severity = error_severity
-        error_log.processing_stage = processing_stage
-        error_log.error_description = error_description
-        if additional_detail:
-            error_log.additional_detail = json.dumps(additional_detail)
-        error_log.insert()
+        error_log = {
+            "error_date": today(),
+            "reference_doctype": reference_doctype,
+            "internal_reference": internal_reference,
+            "source_system": source_system,
+            "external_id": external_id,
+            "entity_type": entity_type,
+            "error_category": error_category,
+            "error_severity": error_severity,
+            "processing_stage": processing_stage,
+            "error_description": error_description,
+            "additional_detail": json.dumps(additional_detail) if additional_detail else None
+        }
+        
+        if not buffer_error_log(error_log):
+            insert_error_logs([error_log])
     except Exception as e:
         frappe.log_error(f"Failed to create error log: {str(e)}")
 
-def create_warehouse_for_facility(facility):
+def create_warehouse_for_facility(facility, facility_updates=None, address=None, address_links=None,
+                                  existing_warehouses=None, company=None):
     """
     Creates a warehouse for a given facility if conditions are met
+    facility can be an SF Facility Master doc or a row with name, facility_name,
+    shipping_address, latitude and longitude
+    If facility_updates (facility name -> warehouse) is given, the facility's new warehouse
+    is added to it for a batched update (see update_facility_warehouses) instead of set right away
+    address is the facility's shipping address row (see get_addresses); it is fetched if not given
+    If address_links is given, the (address, warehouse) pair is added to it for a batched link
+    (see link_addresses_to_warehouses) instead of linked right away
+    existing_warehouses (see get_existing_warehouses) avoids attempting the insert when the
+    warehouse name is already taken. If that warehouse is not assigned to any facility (e.g. a
+    previous run inserted it but failed before linking it), it is assigned to this facility and
+    linked to its address instead
+    company defaults to the default company
     Returns the created warehouse doc or None
     """
     if not facility.shipping_address:
@@ -105,7 +210,10 @@ def create_warehouse_for_facility(facility):
         )
         return None
     
-    state = get_state_from_address(facility.shipping_address)
+    # Read the address once; its state decides the branch and its details go on the warehouse
+    if address is None:
+        address = frappe.db.get_value("Address", facility.shipping_address, ADDRESS_FIELDS, as_dict=True)
+    state = address.state if address else None
     if not state:
         msg = f"Skipping warehouse creation for facility {facility.name}: No state in address"
         frappe.logger().debug(msg)
@@ -140,15 +248,36 @@ def create_warehouse_for_facility(facility):
             additional_detail={"facility": facility.name, "state": state}
         )
         return None
+    warehouse_name = get_warehouse_name(facility, branch)
+    existing_warehouse = existing_warehouses.get(warehouse_name) if existing_warehouses is not None else None
+    if existing_warehouse and not existing_warehouse.facility:
+        frappe.logger().info(
+            f"Assigning existing warehouse {existing_warehouse.name} to facility {facility.name}"
+        )
+        existing_warehouse.facility = facility.name
+        assign_warehouse_to_facility(facility, existing_warehouse.name, facility_updates, address_links)
+        return None
+    if existing_warehouse:
+        msg = f"Skipping warehouse creation for facility {facility.name}: Warehouse {warehouse_name} already exists"
+        frappe.logger().debug(msg)
+        create_error_log(
+            reference_doctype="SF Facility Master",
+            internal_reference=facility.name,
+            source_system="Internal Processing",
+            external_id=facility.name,
+            entity_type="Warehouse",
+            error_category="Duplicate Record",
+            error_severity="High",
+            processing_stage="Warehouse Assignment",
+            error_description=msg,
+            additional_detail={"facility": facility.name, "warehouse_name": warehouse_name}
+        )
+        return None
     try:
-        branch_suffix = get_branch_suffix(branch)
-        warehouse_name = f"{facility.facility_name}-{branch_suffix}"
-        # Get address details
-        address = frappe.get_doc("Address", facility.shipping_address)
         warehouse = frappe.get_doc({
             "doctype": "Warehouse",
             "warehouse_name": warehouse_name,
-            "company": frappe.defaults.get_defaults().get("company"),
+            "company": company or frappe.defaults.get_defaults().get("company"),
             "parent_warehouse": PARENT_WAREHOUSE,
             "warehouse_type": WAREHOUSE_TYPE,
             "custom_warehouse_category": WAREHOUSE_CATEGORY,
@@ -164,10 +293,9 @@ def create_warehouse_for_facility(facility):
             "email_id": address.email_id
         })
         warehouse.insert()
-        # Link address to warehouse
-        link_address_to_warehouse(warehouse.name, facility.shipping_address)
-        # Update facility with new warehouse
-        frappe.db.set_value("SF Facility Master", facility.name, "warehouse", warehouse.name)
+        if existing_warehouses is not None:
+            existing_warehouses[warehouse_name] = frappe._dict(name=warehouse.name, facility=facility.name)
+        assign_warehouse_to_facility(facility, warehouse.name, facility_updates, address_links)
         return warehouse
     except Exception as e:
         msg = f"Error creating warehouse for facility {facility.name}: {str(e)}"
@@ -186,42 +314,112 @@ def create_warehouse_for_facility(facility):
         )
         return None
 
+def assign_warehouse_to_facility(facility, warehouse, facility_updates=None, address_links=None):
+    """
+    Links the facility's shipping address to the warehouse and sets the warehouse on the facility,
+    batched through address_links and facility_updates when given (see create_warehouse_for_facility)
+    """
+    # Link address to warehouse
+    if address_links is not None:
+        address_links.append((facility.shipping_address, warehouse))
+    else:
+        link_address_to_warehouse(warehouse, facility.shipping_address)
+    # Update facility with the warehouse
+    if facility_updates is not None:
+        facility_updates[facility.name] = warehouse
+    else:
+        frappe.db.set_value("SF Facility Master", facility.name, "warehouse", warehouse)
+
 def process_darkstore_facilities():
     """
     Main function to process all darkstore facilities without warehouses
     """
-    facilities = frappe.get_all(
-        "SF Facility Master",
-        filters={
-            "type": "Darkstore",
-            "warehouse": ("is", "not set")
-        },
-        fields=["*"]
-    )
+    # Buffer the error logs of the run, flush_error_logs writes them with one multi-row INSERT
+    start_error_log_buffer()
+    try:
+        facilities = frappe.get_all(
+            "SF Facility Master",
+            filters={
+                "type": "Darkstore",
+                "warehouse": ("is", "not set")
+            },
+            # Only the fields read by create_warehouse_for_facility; the rows are used as they are
+            # instead of loading every facility document again
+            fields=["name", "facility_name", "shipping_address", "latitude", "longitude"]
+        )
+        
+        # Fetch the shipping addresses of all facilities in one query
+        addresses = get_addresses({facility.shipping_address for facility in facilities if facility.shipping_address})
+        
+        # Warehouses are still inserted one by one (naming, validation and the warehouse tree need
+        # the document), but names that are already taken are found with one query up front
+        # instead of failing the insert for each of them
+        warehouse_names = set()
+        for facility in facilities:
+            address = addresses.get(facility.shipping_address)
+            branch = get_branch_from_state(address.state) if address else None
+            if branch:
+                warehouse_names.add(get_warehouse_name(facility, branch))
+        # The default company is the same for every warehouse, read it once
+        company = frappe.defaults.get_defaults().get("company")
+        existing_warehouses = get_existing_warehouses(warehouse_names, company)
+        
+        created_warehouses = []
+        facility_updates = {}
+        address_links = []
+        for facility in facilities:
+            try:
+                warehouse = create_warehouse_for_facility(
+                    facility, facility_updates, addresses.get(facility.shipping_address), address_links,
+                    existing_warehouses, company
+                )
+                if warehouse:
+                    created_warehouses.append(warehouse.name)
+            except Exception as e:
+                msg = f"Error creating warehouse for facility {facility.name}: {str(e)}"
+                frappe.logger().error(msg)
+                create_error_log(
+                    reference_doctype="SF Facility Master",
+                    internal_reference=facility.name,
+                    source_system="Internal Processing",
+                    external_id=facility.name,
+                    entity_type="Warehouse",
+                    error_category="Warehouse Assignment",
+                    error_severity="Critical",
+                    processing_stage="Record Creation",
+                    error_description=msg,
+                    additional_detail={"facility": facility.name, "error": str(e)}
+                )
+                continue
+        
+        link_addresses_to_warehouses(address_links)
+        update_facility_warehouses(facility_updates)
+        return created_warehouses
+    finally:
+        flush_error_logs()
+
+def update_facility_warehouses(facility_updates):
+    """
+    Sets the warehouse of several SF Facility Master records with one UPDATE
+    facility_updates: facility name -> warehouse name
+    """
+    if not facility_updates:
+        return
     
-    created_warehouses = []
-    for facility in facilities:
-        try:
-            warehouse = create_warehouse_for_facility(frappe.get_doc("SF Facility Master", facility.name))
-            if warehouse:
-                created_warehouses.append(warehouse.name)
-        except Exception as e:
-            msg = f"Error creating warehouse for facility {facility.name}: {str(e)}"
-            frappe.logger().error(msg)
-            create_error_log(
-                reference_doctype="SF Facility Master",
-                internal_reference=facility.name,
-                source_system="Internal Processing",
-                external_id=facility.name,
-                entity_type="Warehouse",
-                error_category="Warehouse Assignment",
-                error_severity="Critical",
-                processing_stage="Record Creation",
-                error_description=msg,
-                additional_detail={"facility": facility.name, "error": str(e)}
-            )
-            continue
-    return created_warehouses
+    values = {"modified": now(), "modified_by": frappe.session.user, "names": list(facility_updates)}
+    cases = []
+    for i, (facility_name, warehouse_name) in enumerate(facility_updates.items()):
+        values[f"facility_{i}"] = facility_name
+        values[f"warehouse_{i}"] = warehouse_name
+        cases.append(f"WHEN %(facility_{i})s THEN %(warehouse_{i})s")
+    
+    frappe.db.sql(f"""
+        UPDATE `tabSF Facility Master`
+        SET warehouse = CASE name {" ".join(cases)} END,
+            modified = %(modified)s,
+            modified_by = %(modified_by)s
+        WHERE name IN %(names)s
+    """, values)
 
 @frappe.whitelist()
 def create_missing_darkstore_warehouses():
@@ -5,11 +5,59 @@ import json
 from frappe.utils import now_datetime, get_datetime_str, today
 from datetime import datetime
 import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from inv_mgmt.custom_inventory_management.doctype.sf_product_master.sf_product_master import SF_PRODUCT_MAPS_CACHE_KEY
+from inv_mgmt.custom_inventory_management.doctype.sf_inventory_data_import_error_logs.sf_inventory_data_import_error_logs import (
+    buffer_error_log, flush_error_logs, insert_error_logs, start_error_log_buffer
+)
 
-# Time delay for D2C order API calls (5 seconds)
+# orjson ships with Frappe; fall back to requests' own JSON decoding if it is missing
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Longest wait for the D2C order API to return the orders_link (3 minutes)
 D2C_ORDER_API_DELAY_SECONDS = 180
-# Time delay for B2B order API calls (5 seconds)
+# Longest wait for the B2B order API to return the orders_link (45 seconds)
 B2B_ORDER_API_DELAY_SECONDS = 45
+# Longest order API wait per order type
+ORDER_API_MAX_WAIT_SECONDS = {
+    "d2c": D2C_ORDER_API_DELAY_SECONDS,
+    "b2b": B2B_ORDER_API_DELAY_SECONDS
+}
+# First wait between order API polls, doubled after every poll
+ORDER_API_POLL_INITIAL_DELAY_SECONDS = 5
+# Number of imported orders per committed transaction
+ORDER_IMPORT_COMMIT_SIZE = 200
+# Savepoint set before each imported order, so a failed order is undone on its own
+ORDER_IMPORT_SAVEPOINT = "sf_order_import"
+# (connect, read) timeout of order API and orders file requests
+ORDER_API_TIMEOUT = (5, 60)
+
+# How long the SF Product Master lookup maps stay cached; product changes clear them right away
+SF_PRODUCT_MAPS_CACHE_SECONDS = 300
+# Number of orders between import progress messages
+ORDER_IMPORT_PROGRESS_INTERVAL = 100
+
+
+def get_logger():
+    """
+    Logger of the order import jobs (per site, cached by frappe.logger). Messages use lazy
+    % formatting, so per-order debug messages cost nothing unless debug logging is enabled.
+    """
+    return frappe.logger("sf_order_import", allow_site=True)
+
+
+# Shared HTTP session for the D2C and B2B order APIs and orders file downloads - keeps connections
+# alive between the API calls instead of a new TCP + TLS handshake per call, and retries gateway errors
+order_api_session = requests.Session()
+order_api_session.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=4,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504])
+))
 
 def create_error_log(reference_doctype=None, internal_reference=None, source_system=None, 
                      external_id=None, entity_type=None, error_category=None, 
@@ -17,185 +65,99 @@ def create_error_log(reference_doctype=None, internal_reference=None, source_sys
                      additional_detail=None):
     """
     Create an error log entry in SF Inventory Data Import Error Logs
+    While an import runs the entry is buffered and written with the others by flush_error_logs
+    (see sf_inventory_data_import_error_logs)
     """
-    try:
-        error_log = frappe.new_doc("SF Inventory Data Import Error Logs")
-        error_log.error_date = today()
-        error_log.reference_doctype = reference_doctype
-        error_log.internal_reference = internal_reference
-        error_log.source_system = source_system
-        error_log.external_id = external_id
-        error_log.entity_type = entity_type
-        error_log.error_category = error_category
-        error_log.error_severity = error_severity
-        error_log.processing_stage = processing_stage
-        error_log.error_description = error_description
-        if additional_detail:
-            error_log.additional_detail = json.dumps(additional_detail)
-        
-        error_log.insert()
-        print(f"Created error log: {error_log.name}")
-        
-    except Exception as e:
-        print(f"Failed to create error log: {str(e)}")
+    error_log = {
+        "error_date": today(),
+        "reference_doctype": reference_doctype,
+        "internal_reference": internal_reference,
+        "source_system": source_system,
+        "external_id": external_id,
+        "entity_type": entity_type,
+        "error_category": error_category,
+        "error_severity": error_severity,
+        "processing_stage": processing_stage,
+        "error_description": error_description,
+        "additional_detail": json.dumps(additional_detail) if additional_detail else None
+    }
+    
+    if not buffer_error_log(error_log):
+        insert_error_logs([error_log])
 
 
-def import_d2c_orders(delivery_date : str):
+def poll_orders_link(api_url, headers, request_data, max_wait_seconds):
+    """
+    Call the order API until it returns the orders_link. The first call asks the API to
+    generate the orders file; later calls wait with exponential backoff, for at most
+    max_wait_seconds in total, so a file that is ready early does not wait the full delay.
+    Returns the data of the last API response
+    """
+    logger = get_logger()
+    
+    start = time.monotonic()
+    delay = ORDER_API_POLL_INITIAL_DELAY_SECONDS
+    while True:
+        response = order_api_session.get(api_url, headers=headers, json=request_data, timeout=ORDER_API_TIMEOUT)
+        response.raise_for_status()
+        
+        response_data = response.json()
+        logger.debug("Order API response: %s", response_data)
+        
+        if response_data.get("success") and response_data.get("orders_link"):
+            return response_data
+        
+        remaining = max_wait_seconds - (time.monotonic() - start)
+        if remaining <= 0:
+            return response_data
+        
+        delay = min(delay, remaining)
+        logger.info("Orders link not ready, waiting %.0f seconds before next API call...", delay)
+        time.sleep(delay)
+        delay *= 2
+
+
+def request_orders_file(order_type, delivery_date):
     """
-    Import D2C orders from SF API and create SF Order Master records.
-    Makes two API calls with 5 seconds delay as required.
+    Ask the order API of order_type ("d2c" or "b2b") to start generating the orders file,
+    without waiting for it. The import polls for the file later (see poll_orders_link).
+    Failures are only logged; the import itself reports them.
     """
     try:
-        print("Starting D2C order import process...")
-        
-        # Get API configuration from site config
-        api_url = frappe.conf.get('sf_d2c_order_api_url')
-        api_key = frappe.conf.get('sf_d2c_order_api_key')
-        
+        api_url = frappe.conf.get(f"sf_{order_type}_order_api_url")
+        api_key = frappe.conf.get(f"sf_{order_type}_order_api_key")
         if not api_url or not api_key:
-            frappe.throw("D2C order API configuration (sf_d2c_order_api_url, sf_d2c_order_api_key) missing in site config")
-        
-        # Prepare request headers and data
-        headers = {
-            'Authorization': f'{api_key}',
-            'Content-Type': 'application/json'
-        }
-        
-        request_data = {
-            "delivery_date": delivery_date,
-            "regenerate": False
-        }
-        
-        print(f"Making first API call to {api_url}")
-        print(f"Request data: {json.dumps(request_data)}")
-        
-        # First API call
-        first_response = requests.get(api_url, headers=headers, json=request_data)
-        first_response.raise_for_status()
-        
-        print(f"First API call response: {first_response.json()}")
-        
-        # Wait for 5 seconds as specified
-        print(f"Waiting {D2C_ORDER_API_DELAY_SECONDS} seconds before second API call...")
-        time.sleep(D2C_ORDER_API_DELAY_SECONDS)
-        
-        # Second API call
-        print("Making second API call...")
-        second_response = requests.get(api_url, headers=headers, json=request_data)
-        second_response.raise_for_status()
-        
-        response_data = second_response.json()
-        print(f"Second API call response: {response_data}")
-        
-        if not response_data.get("success"):
-            frappe.throw(f"API returned error: {response_data.get('message', 'Unknown error')}")
-        
-        orders_link = response_data.get("orders_link")
-        if not orders_link:
-            frappe.throw("No orders_link found in API response")
-        
-        print(f"Fetching orders data from: {orders_link}")
-        
-        # Fetch orders data from S3 link
-        orders_response = requests.get(orders_link)
-        orders_response.raise_for_status()
-        orders_data = orders_response.json()
-        
-        if not isinstance(orders_data, list):
-            frappe.throw("Expected orders data to be a list")
-        
-        print(f"Found {len(orders_data)} orders to process")
-        
-        # Start transaction for all order creation
-        frappe.db.begin()
-        
-        success_count = 0
-        error_count = 0
-        skipped_count = 0
-        errors = []
-        
-        for order_data in orders_data:
-            try:
-                print(f"Processing order: {order_data.get('order_id')}")
-                result = create_order_master_record(order_data)
-                if result == "skipped":
-                    skipped_count += 1
-                    print(f"Skipped existing order: {order_data.get('order_id')}")
-                else:
-                    success_count += 1
-                    print(f"Successfully created order: {order_data.get('order_id')}")
-                
-            except Exception as e:
-                error_count += 1
-                order_id = order_data.get("order_id")
-                error_detail = {
-                    "order_id": order_id,
-                    "error": str(e)
-                }
-                errors.append(error_detail)
-                
-                print(f"Error processing order {order_id}: {str(e)}")
-                
-                # Create comprehensive error log
-                error_description = f"Failed to process D2C Order {order_id} during import: {str(e)}"
-                create_error_log(
-                    source_system="SF Order API",
-                    external_id=order_id,
-                    entity_type="Order D2C",
-                    error_category="Order Processing",
-                    error_severity="High",
-                    processing_stage="Record Creation",
-                    error_description=error_description,
-                    additional_detail={
-                        "error": str(e),
-                        "order_data": order_data,
-                        "import_process": "D2C Order Import"
-                    }
-                )
-                
-                frappe.log_error(
-                    title=f"D2C Order Import Error - {order_id}",
-                    message=f"Error: {str(e)}\nOrder Data: {json.dumps(order_data, indent=2)}"
-                )
-        
-        # Commit transaction
-        frappe.db.commit()
-        
-        print(f"D2C order import completed. Success: {success_count}, Skipped: {skipped_count}, Errors: {error_count}")
-        
-        return {
-            "success": True,
-            "message": f"D2C order import completed. Success: {success_count}, Skipped: {skipped_count}, Errors: {error_count}",
-            "errors": errors if errors else None
-        }
+            return
         
-    except Exception as e:
-        frappe.db.rollback()
-        print(f"Critical error during D2C order import: {str(e)}")
-        frappe.log_error(
-            title="D2C Order Import - Critical Error",
-            message=f"Error: {str(e)}\nTraceback: {frappe.get_traceback()}"
+        response = order_api_session.get(
+            api_url,
+            headers={'Authorization': f'{api_key}', 'Content-Type': 'application/json'},
+            json={"delivery_date": delivery_date, "regenerate": False},
+            timeout=ORDER_API_TIMEOUT
         )
-        return {
-            "success": False,
-            "message": f"Critical error during D2C order import: {str(e)}"
-        }
+        response.raise_for_status()
+    except Exception as e:
+        get_logger().warning("Could not request the %s orders file: %s", order_type, e)
 
 
-def import_b2b_orders(delivery_date : str):
+def import_orders(order_type, delivery_date):
     """
-    Import B2B orders from SF API and create SF Order Master records.
-    Makes two API calls with 5 seconds delay as required.
+    Import the orders of order_type ("d2c" or "b2b") from SF API and create SF Order Master records.
+    Polls the API until it returns the orders link (see poll_orders_link).
     """
+    logger = get_logger()
+    start_error_log_buffer()
+    label = order_type.upper()
+    
     try:
-        print("Starting B2B order import process...")
+        logger.info("Starting %s order import process...", label)
         
         # Get API configuration from site config
-        api_url = frappe.conf.get('sf_b2b_order_api_url')
-        api_key = frappe.conf.get('sf_b2b_order_api_key')
+        api_url = frappe.conf.get(f"sf_{order_type}_order_api_url")
+        api_key = frappe.conf.get(f"sf_{order_type}_order_api_key")
         
         if not api_url or not api_key:
-            frappe.throw("B2B order API configuration (sf_b2b_order_api_url, sf_b2b_order_api_key) missing in site config")
+            frappe.throw(f"{label} order API configuration (sf_{order_type}_order_api_url, sf_{order_type}_order_api_key) missing in site config")
         
         # Prepare request headers and data
         headers = {
@@ -208,26 +170,11 @@ def import_b2b_orders(delivery_date : str):
             "regenerate": False
         }
         
-        print(f"Making first API call to {api_url}")
-        print(f"Request data: {json.dumps(request_data)}")
-        
-        # First API call
-        first_response = requests.get(api_url, headers=headers, json=request_data)
-        first_response.raise_for_status()
-        
-        print(f"First API call response: {first_response.json()}")
-        
-        # Wait for 5 seconds as specified
-        print(f"Waiting {B2B_ORDER_API_DELAY_SECONDS} seconds before second API call...")
-        time.sleep(B2B_ORDER_API_DELAY_SECONDS)
+        logger.info("Polling order API at %s", api_url)
+        logger.debug("Request data: %s", request_data)
         
-        # Second API call
-        print("Making second API call...")
-        second_response = requests.get(api_url, headers=headers, json=request_data)
-        second_response.raise_for_status()
-        
-        response_data = second_response.json()
-        print(f"Second API call response: {response_data}")
+        # Poll the API until the orders file is ready instead of always waiting the full delay
+        response_data = poll_orders_link(api_url, headers, request_data, ORDER_API_MAX_WAIT_SECONDS[order_type])
         
         if not response_data.get("success"):
             frappe.throw(f"API returned error: {response_data.get('message', 'Unknown error')}")
@@ -236,19 +183,36 @@ def import_b2b_orders(delivery_date : str):
         if not orders_link:
             frappe.throw("No orders_link found in API response")
         
-        print(f"Fetching orders data from: {orders_link}")
+        logger.info("Fetching orders data from: %s", orders_link)
         
-        # Fetch orders data from S3 link
-        orders_response = requests.get(orders_link)
+        # Fetch orders data from S3 link. The raw bytes are parsed directly (without decoding
+        # them to a text copy first) and released before the orders are processed
+        orders_response = order_api_session.get(orders_link, timeout=ORDER_API_TIMEOUT)
         orders_response.raise_for_status()
-        orders_data = orders_response.json()
+        orders_data = orjson.loads(orders_response.content) if orjson else orders_response.json()
+        del orders_response
         
         if not isinstance(orders_data, list):
             frappe.throw("Expected orders data to be a list")
         
-        print(f"Found {len(orders_data)} B2B orders to process")
+        logger.info("Found %s %s orders to process", len(orders_data), label)
+        
+        # Find the orders that were imported before with one query
+        existing_order_ids = load_existing_order_ids(orders_data)
+        
+        # Load the plant and darkstore facilities of the import at once
+        facility_map = load_facility_map(
+            [(order_data.get("plant") or {}).get("plant_id") for order_data in orders_data]
+            + [(order_data.get("darkstore") or {}).get("darkstore_id") for order_data in orders_data]
+        )
+        
+        # SF Product Master lookup maps of all SKUs, shared by the imports through the cache
+        product_maps = load_sf_product_maps()
+        
+        create_record = create_b2b_order_master_record if order_type == "b2b" else create_order_master_record
         
-        # Start transaction for all order creation
+        # Start transaction for order creation. It is committed every ORDER_IMPORT_COMMIT_SIZE
+        # orders, so row locks and undo log stay bounded and a late failure keeps earlier chunks
         frappe.db.begin()
         
         success_count = 0
@@ -256,34 +220,50 @@ def import_b2b_orders(delivery_date : str):
         skipped_count = 0
         errors = []
         
-        for order_data in orders_data:
+        for index, order_data in enumerate(orders_data, 1):
+            # A failed order is rolled back to this savepoint, so its partial writes (or a facility
+            # created for it) are not committed with the rest of the chunk
+            facility_count = len(facility_map)
+            frappe.db.savepoint(ORDER_IMPORT_SAVEPOINT)
             try:
-                print(f"Processing B2B order: {order_data.get('order_id')}")
-                result = create_b2b_order_master_record(order_data)
+                logger.debug("Processing %s order: %s", label, order_data.get("order_id"))
+                result = create_record(
+                    order_data,
+                    product_maps=product_maps,
+                    existing_order_ids=existing_order_ids,
+                    facility_map=facility_map
+                )
                 if result == "skipped":
                     skipped_count += 1
-                    print(f"Skipped existing B2B order: {order_data.get('order_id')}")
+                    logger.debug("Skipped existing %s order: %s", label, order_data.get("order_id"))
                 else:
                     success_count += 1
-                    print(f"Successfully created B2B order: {order_data.get('order_id')}")
+                    logger.debug("Successfully created %s order: %s", label, order_data.get("order_id"))
                 
             except Exception as e:
-                error_count += 1
+                frappe.db.rollback(save_point=ORDER_IMPORT_SAVEPOINT)
                 order_id = order_data.get("order_id")
+                
+                # Forget what the rolled back order added to the lookup maps
+                for facility_key in list(facility_map)[facility_count:]:
+                    del facility_map[facility_key]
+                existing_order_ids.discard(order_id)
+                
+                error_count += 1
                 error_detail = {
                     "order_id": order_id,
                     "error": str(e)
                 }
                 errors.append(error_detail)
                 
-                print(f"Error processing B2B order {order_id}: {str(e)}")
+                logger.error("Error processing %s order %s: %s", label, order_id, e)
                 
                 # Create comprehensive error log
-                error_description = f"Failed to process B2B Order {order_id} during import: {str(e)}"
+                error_description = f"Failed to process {label} Order {order_id} during import: {str(e)}"
                 create_error_log(
                     source_system="SF Order API",
                     external_id=order_id,
-                    entity_type="Order B2B",
+                    entity_type=f"Order {label}",
                     error_category="Order Processing",
                     error_severity="High",
                     processing_stage="Record Creation",
@@ -291,55 +271,100 @@ def import_b2b_orders(delivery_date : str):
                     additional_detail={
                         "error": str(e),
                         "order_data": order_data,
-                        "import_process": "B2B Order Import"
+                        "import_process": f"{label} Order Import"
                     }
                 )
                 
                 frappe.log_error(
-                    title=f"B2B Order Import Error - {order_id}",
-                    message=f"Error: {str(e)}\nOrder Data: {json.dumps(order_data, indent=2)}"
+                    title=f"{label} Order Import Error - {order_id}",
+                    message=str(e)
                 )
+            
+            if index % ORDER_IMPORT_COMMIT_SIZE == 0:
+                frappe.db.commit()
+            
+            if index % ORDER_IMPORT_PROGRESS_INTERVAL == 0:
+                logger.info("Processed %s of %s %s orders", index, len(orders_data), label)
         
         # Commit transaction
         frappe.db.commit()
         
-        print(f"B2B order import completed. Success: {success_count}, Skipped: {skipped_count}, Errors: {error_count}")
+        logger.info("%s order import completed. Success: %s, Skipped: %s, Errors: %s", label, success_count, skipped_count, error_count)
         
         return {
             "success": True,
-            "message": f"B2B order import completed. Success: {success_count}, Skipped: {skipped_count}, Errors: {error_count}",
+            "message": f"{label} order import completed. Success: {success_count}, Skipped: {skipped_count}, Errors: {error_count}",
             "errors": errors if errors else None
         }
         
     except Exception as e:
         frappe.db.rollback()
-        print(f"Critical error during B2B order import: {str(e)}")
+        logger.error("Critical error during %s order import: %s", label, e)
         frappe.log_error(
-            title="B2B Order Import - Critical Error",
+            title=f"{label} Order Import - Critical Error",
             message=f"Error: {str(e)}\nTraceback: {frappe.get_traceback()}"
         )
         return {
             "success": False,
-            "message": f"Critical error during B2B order import: {str(e)}"
+            "message": f"Critical error during {label} order import: {str(e)}"
         }
+    finally:
+        # The buffered error logs are written after the orders are committed or rolled back
+        flush_error_logs()
+        frappe.db.commit()
+
+
+def import_d2c_orders(delivery_date : str):
+    """
+    Import D2C orders from SF API and create SF Order Master records (see import_orders)
+    """
+    return import_orders("d2c", delivery_date)
+
+
+def import_b2b_orders(delivery_date : str):
+    """
+    Import B2B orders from SF API and create SF Order Master records (see import_orders)
+    """
+    return import_orders("b2b", delivery_date)
+
+
+def load_existing_order_ids(orders_data):
+    """
+    Get the order IDs of the orders that are already in SF Order Master with one query
+    Returns a set of order IDs
+    """
+    order_ids = [order_data.get("order_id") for order_data in orders_data if order_data.get("order_id")]
+    if not order_ids:
+        return set()
+    
+    return set(frappe.get_all(
+        "SF Order Master",
+        filters={"order_id": ["in", order_ids]},
+        pluck="order_id"
+    ))
 
 
-def create_order_master_record(order_data):
+def create_order_master_record(order_data, product_maps=None, existing_order_ids=None, facility_map=None):
     """
     Create SF Order Master record from D2C order data
+    product_maps (see load_sf_product_maps) replaces the per-SKU SF Product Master queries
+    existing_order_ids (see load_existing_order_ids) replaces the per-order existence query;
+    the created order's ID is added to it
+    facility_map (see load_facility_map) replaces the per-order facility queries
     """
+    logger = get_logger()
+    
     try:
         order_id = order_data.get("order_id")
         
         # Check if order already exists
-        existing_order = frappe.get_all(
-            "SF Order Master",
-            filters={"order_id": order_id},
-            fields=["name"]
-        )
+        if existing_order_ids is not None:
+            existing_order = order_id in existing_order_ids
+        else:
+            existing_order = frappe.db.exists("SF Order Master", {"order_id": order_id})
         
         if existing_order:
-            print(f"Order {order_id} already exists, skipping...")
+            logger.debug("Order %s already exists, skipping...", order_id)
             return "skipped"
 
         # Validate darkstore presence for D2C orders (mandatory for D2C)
@@ -360,7 +385,7 @@ def create_order_master_record(order_data):
                     "validation_rule": "D2C orders require valid darkstore information"
                 }
             )
-            print(f"Error: {error_description}")
+            logger.error("Error: %s", error_description)
             raise Exception(error_description)
         
         # Get or create plant facility
@@ -368,7 +393,8 @@ def create_order_master_record(order_data):
         plant_facility = get_or_create_facility(
             facility_id=plant_data.get("plant_id"),
             facility_name=plant_data.get("plant_name"),
-            facility_type="Plant"
+            facility_type="Plant",
+            facility_map=facility_map
         )
         
         # Get or create darkstore facility
@@ -378,7 +404,8 @@ def create_order_master_record(order_data):
             facility_latitude=darkstore_data.get("latitude"),
             facility_longitude=darkstore_data.get("longitude"),
             facility_address=darkstore_data.get("address"),
-            facility_type="Darkstore"
+            facility_type="Darkstore",
+            facility_map=facility_map
         )
         
         # Create SF Order Master document
@@ -396,35 +423,44 @@ def create_order_master_record(order_data):
         # Currency default
         order_master.currency = "INR"
         
-        # Process SKU summary to create order items
+        # Process SKU summary to create order items. The item rows are built as plain dicts
+        # and set on the order at once, totals are computed from the same values
         sku_summary = order_data.get("sku_summary", [])
+        item_rows = []
         total_amount = 0
         has_invalid_items = False
         
         for sku in sku_summary:
             sku_id = sku.get("sku_id")
             sku_name = sku.get("sku_name")
+            quantity = sku.get("quantity", 0)
             
             # Find corresponding SF Product Master
-            sf_product = get_sf_product_by_sku(sku_id, sku_name)
-            
-            # Create order item
-            order_item = order_master.append("item_table", {})
-            order_item.item_id = sku_id
-            order_item.item_name = sku_name
-            order_item.quantity = sku.get("quantity", 0)
+            sf_product = get_sf_product_by_sku(sku_id, sku_name, product_maps)
             
             if sf_product:
-                order_item.unit_price = sf_product.get("offer_price", 0)
-                order_item.total_price = order_item.quantity * order_item.unit_price
-                order_item.sf_product_master = sf_product.get("name")
-                order_item.is_invalid_item = 0
-                total_amount += order_item.total_price
+                unit_price = sf_product.get("offer_price", 0)
+                total_price = quantity * unit_price
+                item_rows.append({
+                    "item_id": sku_id,
+                    "item_name": sku_name,
+                    "quantity": quantity,
+                    "unit_price": unit_price,
+                    "total_price": total_price,
+                    "sf_product_master": sf_product.get("name"),
+                    "is_invalid_item": 0
+                })
+                total_amount += total_price
             else:
                 # Mark as invalid item
-                order_item.unit_price = 0
-                order_item.total_price = 0
-                order_item.is_invalid_item = 1
+                item_rows.append({
+                    "item_id": sku_id,
+                    "item_name": sku_name,
+                    "quantity": quantity,
+                    "unit_price": 0,
+                    "total_price": 0,
+                    "is_invalid_item": 1
+                })
                 has_invalid_items = True
                 
                 # Create error log for missing product
@@ -445,7 +481,9 @@ def create_order_master_record(order_data):
                     }
                 )
                 
-                print(f"Warning: SF Product Master not found for SKU {sku_id} - {sku_name}")
+                logger.warning("SF Product Master not found for SKU %s - %s", sku_id, sku_name)
+        
+        order_master.set("item_table", item_rows)
         
         # Set invalid item flag at order level
         order_master.is_invalid_item_present = 1 if has_invalid_items else 0
@@ -454,8 +492,12 @@ def create_order_master_record(order_data):
         order_master.subtotal = total_amount
         order_master.total_amount = total_amount
         
-        # Save the document
+        # Save the document. Its links (facilities, SF Product Masters) were all just read from
+        # the database, so the per-link existence queries of insert are skipped
+        order_master.flags.ignore_links = True
         order_master.insert()
+        if existing_order_ids is not None:
+            existing_order_ids.add(order_id)
         
         # If order has invalid items, create an order-level error log
         if has_invalid_items:
@@ -478,7 +520,7 @@ def create_order_master_record(order_data):
                 }
             )
         
-        print(f"Created SF Order Master: {order_master.name}")
+        logger.debug("Created SF Order Master: %s", order_master.name)
         return "created"
         
     except Exception as e:
@@ -497,26 +539,31 @@ def create_order_master_record(order_data):
                 "order_data": order_data
             }
         )
-        print(f"Error creating order master record: {str(e)}")
+        logger.error("Error creating order master record: %s", e)
         raise
 
 
-def create_b2b_order_master_record(order_data):
+def create_b2b_order_master_record(order_data, product_maps=None, existing_order_ids=None, facility_map=None):
     """
     Create SF Order Master record from B2B order data
+    product_maps (see load_sf_product_maps) replaces the per-SKU SF Product Master queries
+    existing_order_ids (see load_existing_order_ids) replaces the per-order existence query;
+    the created order's ID is added to it
+    facility_map (see load_facility_map) replaces the per-order facility queries
     """
+    logger = get_logger()
+    
     try:
         order_id = order_data.get("order_id")
         
         # Check if order already exists
-        existing_order = frappe.get_all(
-            "SF Order Master",
-            filters={"order_id": order_id},
-            fields=["name"]
-        )
+        if existing_order_ids is not None:
+            existing_order = order_id in existing_order_ids
+        else:
+            existing_order = frappe.db.exists("SF Order Master", {"order_id": order_id})
         
         if existing_order:
-            print(f"B2B Order {order_id} already exists, skipping...")
+            logger.debug("B2B Order %s already exists, skipping...", order_id)
             return "skipped"
         
         # Get or create plant facility
@@ -524,7 +571,8 @@ def create_b2b_order_master_record(order_data):
         plant_facility = get_or_create_facility(
             facility_id=plant_data.get("plant_id"),
             facility_name=plant_data.get("plant_name"),
-            facility_type="Plant"
+            facility_type="Plant",
+            facility_map=facility_map
         )
         
         # Get or create darkstore facility (optional for B2B orders)
@@ -537,7 +585,8 @@ def create_b2b_order_master_record(order_data):
                 facility_latitude=darkstore_data.get("latitude"),
                 facility_longitude=darkstore_data.get("longitude"),
                 facility_address=darkstore_data.get("address"),
-                facility_type="Darkstore"
+                facility_type="Darkstore",
+                facility_map=facility_map
             )
         
         # Create SF Order Master document
@@ -589,9 +638,10 @@ def create_b2b_order_master_record(order_data):
         else:
             order_master.currency = "INR"
         
-        # Process items to create order items
+        # Process items to create order items. The item rows are built as plain dicts
+        # and set on the order at once
         items = order_data.get("items", [])
-        calculated_total = 0
+        item_rows = []
         has_invalid_items = False
         
         for item in items:
@@ -599,22 +649,24 @@ def create_b2b_order_master_record(order_data):
             sku_name = item.get("sku_name")
             
             # Find corresponding SF Product Master
-            sf_product = get_sf_product_by_sku(sku_id, sku_name)
+            sf_product = get_sf_product_by_sku(sku_id, sku_name, product_maps)
             
             # Create order item (even if product not found, we'll use the provided data)
-            order_item = order_master.append("item_table", {})
-            order_item.item_id = sku_id
-            order_item.item_name = sku_name
-            order_item.quantity = item.get("quantity", 0)
-            order_item.unit_price = item.get("unit_price", 0)
-            order_item.total_price = item.get("total_price", 0)
+            order_item = {
+                "item_id": sku_id,
+                "item_name": sku_name,
+                "quantity": item.get("quantity", 0),
+                "unit_price": item.get("unit_price", 0),
+                "total_price": item.get("total_price", 0)
+            }
+            item_rows.append(order_item)
             
             if sf_product:
-                order_item.sf_product_master = sf_product.get("name")
-                order_item.is_invalid_item = 0
+                order_item["sf_product_master"] = sf_product.get("name")
+                order_item["is_invalid_item"] = 0
             else:
                 # Mark as invalid item
-                order_item.is_invalid_item = 1
+                order_item["is_invalid_item"] = 1
                 has_invalid_items = True
                 
                 # Create error log for missing product
@@ -635,20 +687,25 @@ def create_b2b_order_master_record(order_data):
                     }
                 )
                 
-                print(f"Warning: SF Product Master not found for SKU {sku_id} - {sku_name}")
-            
-            calculated_total += order_item.total_price
+                logger.warning("SF Product Master not found for SKU %s - %s", sku_id, sku_name)
+        
+        order_master.set("item_table", item_rows)
         
         # Set invalid item flag at order level
         order_master.is_invalid_item_present = 1 if has_invalid_items else 0
         
         # If no invoice total was provided, use calculated total
         if not order_master.total_amount:
+            calculated_total = sum(order_item["total_price"] for order_item in item_rows)
             order_master.total_amount = calculated_total
             order_master.subtotal = calculated_total
         
-        # Save the document
+        # Save the document. Its links (facilities, SF Product Masters) were all just read from
+        # the database, so the per-link existence queries of insert are skipped
+        order_master.flags.ignore_links = True
         order_master.insert()
+        if existing_order_ids is not None:
+            existing_order_ids.add(order_id)
         
         # If order has invalid items, create an order-level error log
         if has_invalid_items:
@@ -671,7 +728,7 @@ def create_b2b_order_master_record(order_data):
                 }
             )
         
-        print(f"Created B2B SF Order Master: {order_master.name}")
+        logger.debug("Created B2B SF Order Master: %s", order_master.name)
         return "created"
         
     except Exception as e:
@@ -690,30 +747,56 @@ def create_b2b_order_master_record(order_data):
                 "order_data": order_data
             }
         )
-        print(f"Error creating B2B order master record: {str(e)}")
+        logger.error("Error creating B2B order master record: %s", e)
         raise
 
 
-def get_or_create_facility(facility_id, facility_name, facility_type, facility_latitude = None, facility_longitude = None, facility_address = None):
+def load_facility_map(facility_ids):
+    """
+    Load the SF Facility Masters of the given facility IDs with one query
+    Returns a dict of (facility_id, facility_name) -> facility name, for get_or_create_facility
+    """
+    facility_ids = list({facility_id for facility_id in facility_ids if facility_id})
+    if not facility_ids:
+        return {}
+    
+    facility_map = {}
+    for facility in frappe.get_all(
+        "SF Facility Master",
+        filters={"facility_id": ["in", facility_ids]},
+        fields=["name", "facility_id", "facility_name"]
+    ):
+        facility_map.setdefault((facility.facility_id, facility.facility_name), facility.name)
+    
+    return facility_map
+
+
+def get_or_create_facility(facility_id, facility_name, facility_type, facility_latitude = None, facility_longitude = None, facility_address = None, facility_map = None):
     """
     Get existing facility or create a new one if not found
+    facility_map (see load_facility_map) replaces the existence query; created facilities are added to it
     """
+    logger = get_logger()
+    
     try:
         # Check if facility exists using facility_id and facility_name
-        existing_facility = frappe.get_all(
-            "SF Facility Master",
-            filters={
-                "facility_id": facility_id,
-                "facility_name": facility_name
-            },
-            fields=["name"]
-        )
-        
-        if existing_facility:
-            return existing_facility[0].name
+        if facility_map is not None:
+            if (facility_id, facility_name) in facility_map:
+                return facility_map[(facility_id, facility_name)]
+        else:
+            existing_facility = frappe.db.exists(
+                "SF Facility Master",
+                {
+                    "facility_id": facility_id,
+                    "facility_name": facility_name
+                }
+            )
+            
+            if existing_facility:
+                return existing_facility
         
         # Create new facility
-        print(f"Creating new {facility_type} facility: {facility_id} - {facility_name}")
+        logger.info("Creating new %s facility: %s - %s", facility_type, facility_id, facility_name)
         
         facility = frappe.new_doc("SF Facility Master")
         facility.facility_id = facility_id
@@ -723,46 +806,73 @@ def get_or_create_facility(facility_id, facility_name, facility_type, facility_l
         facility.longitude = facility_longitude
         facility.address_text = facility_address
         facility.insert()
+        if facility_map is not None:
+            facility_map[(facility_id, facility_name)] = facility.name
         
-        print(f"Created SF Facility Master: {facility.name}")
+        logger.info("Created SF Facility Master: %s", facility.name)
         return facility.name
         
     except Exception as e:
-        print(f"Error creating facility {facility_id}: {str(e)}")
+        logger.error("Error creating facility %s: %s", facility_id, e)
         raise
 
 
-def get_sf_product_by_sku(sku_id, sku_name):
+def load_sf_product_maps():
+    """
+    Load the SF Product Master lookup maps of get_sf_product_by_sku, one per lookup field,
+    from the cache; they are built with one query over all products when not cached.
+    The SF Product Master controller clears the cache when a product changes.
+    Returns a dict of lookup field -> {value: product row with name and offer_price}
+    """
+    product_maps = frappe.cache().get_value(SF_PRODUCT_MAPS_CACHE_KEY)
+    if product_maps is not None:
+        return product_maps
+    
+    lookup_fields = ("sf_product_id", "variant_full_name", "code")
+    product_maps = {field: {} for field in lookup_fields}
+    for product in frappe.get_all(
+        "SF Product Master",
+        fields=["name", "offer_price", *lookup_fields]
+    ):
+        row = frappe._dict(name=product.name, offer_price=product.offer_price)
+        for field in lookup_fields:
+            # Keep the first match, as the single SKU queries do
+            if product.get(field):
+                product_maps[field].setdefault(product.get(field), row)
+    
+    frappe.cache().set_value(SF_PRODUCT_MAPS_CACHE_KEY, product_maps, expires_in_sec=SF_PRODUCT_MAPS_CACHE_SECONDS)
+    return product_maps
+
+
+def get_sf_product_by_sku(sku_id, sku_name, product_maps=None):
     """
     Find SF Product Master by SKU ID or name
+    With product_maps (see load_sf_product_maps) this is a dict lookup without queries
     """
-    try:
-        # First try to find by sf_product_id (assuming it matches sku_id)
-        product = frappe.get_all(
-            "SF Product Master",
-            filters={"sf_product_id": sku_id},
-            fields=["name", "offer_price"]
-        )
-        
-        if product:
-            return product[0]
-        
-        # Try to find by variant_full_name (assuming it matches sku_name)
-        product = frappe.get_all(
-            "SF Product Master",
-            filters={"variant_full_name": sku_name},
-            fields=["name", "offer_price"]
-        )
-        
-        if product:
-            return product[0]
-        
-        # Try to find by code
-        product = frappe.get_all(
-            "SF Product Master",
-            filters={"code": sku_id},
-            fields=["name", "offer_price"]
+    if product_maps is not None:
+        return (
+            product_maps["sf_product_id"].get(sku_id)
+            or product_maps["variant_full_name"].get(sku_name)
+            or product_maps["code"].get(sku_id)
         )
+    
+    try:
+        # One query for the three lookups, in order of priority: sf_product_id (assuming it
+        # matches sku_id), variant_full_name (assuming it matches sku_name), then code
+        product = frappe.db.sql("""
+            SELECT name, offer_price FROM (
+                (SELECT name, offer_price, modified, 1 AS priority
+                 FROM `tabSF Product Master` WHERE sf_product_id = %(sku_id)s)
+                UNION ALL
+                (SELECT name, offer_price, modified, 2 AS priority
+                 FROM `tabSF Product Master` WHERE variant_full_name = %(sku_name)s)
+                UNION ALL
+                (SELECT name, offer_price, modified, 3 AS priority
+                 FROM `tabSF Product Master` WHERE code = %(sku_id)s)
+            ) AS matches
+            ORDER BY priority, modified DESC
+            LIMIT 1
+        """, {"sku_id": sku_id, "sku_name": sku_name}, as_dict=True)
         
         if product:
             return product[0]
@@ -770,7 +880,7 @@ def get_sf_product_by_sku(sku_id, sku_name):
         return None
         
     except Exception as e:
-        print(f"Error finding SF Product Master for SKU {sku_id}: {str(e)}")
+        get_logger().error("Error finding SF Product Master for SKU %s: %s", sku_id, e)
         return None
 
 
@@ -779,38 +889,30 @@ def delete_sf_order_master_records():
     """
     Delete all SF Order Master records for a given date range
     """
+    logger = get_logger()
+    
     try:
         start_date = '2025-07-30'
         end_date = '2025-07-30'
 
-        # Get count before deleting
-        records_to_delete = frappe.get_all(
-            "SF Order Master",
-            filters={
-                "order_date": ["between", [start_date, end_date]]
-            },
-            fields=["name"]
+        # Parameterized delete on the indexed order_date; ROW_COUNT() gives the number of
+        # deleted records without reading their names first
+        frappe.db.sql(
+            "DELETE FROM `tabSF Order Master` WHERE `order_date` BETWEEN %(start_date)s AND %(end_date)s",
+            {"start_date": start_date, "end_date": end_date}
         )
-        
-        count = len(records_to_delete)
+        count = frappe.db.sql("SELECT ROW_COUNT()")[0][0]
         
         if count == 0:
-            print(f"No SF Order Master records found for date range {start_date} to {end_date}")
+            logger.info("No SF Order Master records found for date range %s to %s", start_date, end_date)
             return
         
-        # Delete records using proper syntax
-        # for record in records_to_delete:
-        #     frappe.delete_doc("SF Order Master", record.name)
-        #     print(f"Deleted SF Order Master record: {record.name}")
-    
-        frappe.db.sql(f"DELETE FROM `tabSF Order Master` WHERE `order_date` BETWEEN '{start_date}' AND '{end_date}'")
-        
         frappe.db.commit()
-        print(f"Deleted {count} SF Order Master records for date range {start_date} to {end_date}")
+        logger.info("Deleted %s SF Order Master records for date range %s to %s", count, start_date, end_date)
         
     except Exception as e:
         frappe.db.rollback()
-        print(f"Error deleting SF Order Master records: {str(e)}")
+        logger.error("Error deleting SF Order Master records: %s", e)
         raise
 
 
@@ -818,15 +920,20 @@ def import_all_orders():
     """
     Import both D2C and B2B orders
     """
-    print("Starting combined D2C and B2B order import...")
+    logger = get_logger()
+    logger.info("Starting combined D2C and B2B order import...")
 
     delivery_date = today()
     
+    # Ask for the B2B orders file before importing the D2C orders, so it is generated while
+    # the D2C import runs and the B2B poll usually finds it ready
+    request_orders_file("b2b", delivery_date)
+    
     d2c_result = import_d2c_orders(delivery_date)
-    print(f"D2C Import Result: {d2c_result}")
+    logger.info("D2C Import Result: %s", d2c_result)
     
     b2b_result = import_b2b_orders(delivery_date)
-    print(f"B2B Import Result: {b2b_result}")
+    logger.info("B2B Import Result: %s", b2b_result)
     
     return {
         "d2c_result": d2c_result,
@@ -850,10 +957,10 @@ def enqueue_import_all_orders():
             user="Administrator",
             is_async=True
         )
-        print("Import all orders job has been enqueued successfully")
+        get_logger().info("Import all orders job has been enqueued successfully")
         return {"status": "success", "message": "Job enqueued successfully"}
     except Exception as e:
-        print(f"Error enqueueing import_all_orders job: {str(e)}")
+        get_logger().error("Error enqueueing import_all_orders job: %s", e)
         return {"status": "error", "message": str(e)}
 
 
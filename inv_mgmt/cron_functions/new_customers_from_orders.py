@@ -9,20 +9,11 @@ try:
     from inv_mgmt.cron_functions.create_address_from_lat_long import (
         get_address_from_nominatim,
         is_valid_coordinates,
-        get_address_line1,
-        get_address_line2,
-        get_city,
-        get_state,
-        get_country,
-        get_pincode,
-        NOMINATIM_API_DELAY_SECONDS
+        parse_address
     )
-    import time
 except ImportError:
     # Fallback if import fails
     import requests
-    import time
-    NOMINATIM_API_DELAY_SECONDS = 1
 
 
 def create_error_log(reference_doctype=None, internal_reference=None, source_system=None, 
@@ -739,7 +730,9 @@ def create_addresses_for_b2b_customers():
                     )
                     continue
                 
-                # Get address data from Nominatim API (reusing existing function)
+                # Get address data from Nominatim API (reusing existing function). It waits for the
+                # 1 second rate limit only before real API calls, so cache hits and the last mapping
+                # do not sleep
                 address_data = get_address_from_nominatim(coordinates['latitude'], coordinates['longitude'])
                 
                 if address_data:
@@ -790,11 +783,6 @@ def create_addresses_for_b2b_customers():
                         additional_detail={"mapping": mapping, "coordinates": coordinates}
                     )
                 
-                # Rate limiting - wait 1 second between API calls
-                if len(customer_mappings) > 1:  # Only wait if there are more mappings to process
-                    print(f"Waiting {NOMINATIM_API_DELAY_SECONDS} seconds before next API call...")
-                    time.sleep(NOMINATIM_API_DELAY_SECONDS)
-                
             except Exception as e:
                 error_count += 1
                 error_detail = {
@@ -972,12 +960,13 @@ def create_address_record_for_customer(mapping: Dict[str, Any], address_data: Di
         address_components = address_data.get("address", {})
         
         # Map Nominatim fields to Address fields (reusing existing functions)
-        address_line1 = get_address_line1(address_components)
-        address_line2 = get_address_line2(address_components)
-        city = get_city(address_components)
-        state = get_state(address_components)
-        country = get_country(address_components)
-        pincode = get_pincode(address_components)
+        parsed_address = parse_address(address_components)
+        address_line1 = parsed_address["address_line1"]
+        address_line2 = parsed_address["address_line2"]
+        city = parsed_address["city"]
+        state = parsed_address["state"]
+        country = parsed_address["country"]
+        pincode = parsed_address["pincode"]
         
         # Log what we found for debugging
         print(f"Address components for customer {customer_name}:")
@@ -1,9 +1,132 @@
 # Copyright (c) 2025, Hopnet Communications LLP and contributors
 # For license information, please see license.txt
 
-# import frappe
+import frappe
 from frappe.model.document import Document
+from frappe.utils import cint, now, now_datetime
+
+# Fields of the error logs written by insert_error_logs
+ERROR_LOG_FIELDS = [
+	"error_date", "reference_doctype", "internal_reference", "source_system", "external_id", "entity_type",
+	"error_category", "error_severity", "processing_stage", "error_description", "additional_detail"
+]
+
+# Rows per INSERT statement of insert_error_logs
+ERROR_LOG_INSERT_CHUNK_SIZE = 500
 
 
 class SFInventoryDataImportErrorLogs(Document):
-	pass
+	def autoname(self):
+		# Same SF-IDIEL-{YY}-{MM}-{DD}-{######} names as the doctype's format, taken from the
+		# series that insert_error_logs reserves blocks of
+		self.name = reserve_error_log_names(1)[0]
+
+
+def reserve_error_log_names(count):
+	"""
+	Reserve count consecutive names of today's SF-IDIEL-YY-MM-DD- series with one counter update
+	The series row stays locked until commit, like any naming series
+	Returns a list of names
+	"""
+	prefix = f"SF-IDIEL-{now_datetime():%y-%m-%d}-"
+	current = frappe.db.sql("SELECT `current` FROM `tabSeries` WHERE `name` = %s FOR UPDATE", (prefix,))
+	if current:
+		current = cint(current[0][0])
+		frappe.db.sql("UPDATE `tabSeries` SET `current` = `current` + %s WHERE `name` = %s", (count, prefix))
+	else:
+		# Start after the names already taken under the prefix (e.g. by the doctype's format naming)
+		last_name = frappe.db.sql(
+			"SELECT MAX(`name`) FROM `tabSF Inventory Data Import Error Logs` WHERE `name` LIKE %s",
+			(f"{prefix}%",)
+		)[0][0]
+		current = cint(last_name[len(prefix):]) if last_name else 0
+		frappe.db.sql("INSERT INTO `tabSeries` (`name`, `current`) VALUES (%s, %s)", (prefix, current + count))
+
+	return [f"{prefix}{current + i:06d}" for i in range(1, count + 1)]
+
+
+def start_error_log_buffer():
+	"""
+	Start buffering the error logs passed to buffer_error_log until flush_error_logs writes them
+	An already started buffer is kept
+	"""
+	if getattr(frappe.local, "sf_import_error_logs", None) is None:
+		frappe.local.sf_import_error_logs = []
+
+
+def buffer_error_log(error_log):
+	"""
+	Add error_log (dict of SF Inventory Data Import Error Logs fields) to the started buffer
+	Returns False if no buffer is started, the caller then inserts the log itself
+	"""
+	error_logs = getattr(frappe.local, "sf_import_error_logs", None)
+	if error_logs is None:
+		return False
+
+	error_logs.append(error_log)
+	return True
+
+
+def insert_error_logs(error_logs):
+	"""
+	Insert error logs (dicts of ERROR_LOG_FIELDS) with one multi-row INSERT per
+	ERROR_LOG_INSERT_CHUNK_SIZE logs, without a document per log
+	Names are reserved as one block of the naming series, field defaults are applied and
+	select values are checked against the doctype's options here; an invalid select value is
+	left empty and reported instead of losing the log. Committing is left to the caller
+	"""
+	if not error_logs:
+		return
+
+	try:
+		meta = frappe.get_meta("SF Inventory Data Import Error Logs")
+		defaults = {df.fieldname: df.default for df in meta.fields if df.default}
+		select_options = {
+			df.fieldname: set((df.options or "").split("\n")) for df in meta.fields if df.fieldtype == "Select"
+		}
+
+		timestamp = now()
+		user = frappe.session.user
+		invalid_values = []
+		values = []
+		for name, error_log in zip(reserve_error_log_names(len(error_logs)), error_logs):
+			row = [name, timestamp, timestamp, user, user, 0]
+			for field in ERROR_LOG_FIELDS:
+				value = error_log.get(field)
+				if value is None:
+					value = defaults.get(field)
+				if value and field in select_options and value not in select_options[field]:
+					invalid_values.append(f"{name}: {field} = {value}")
+					value = None
+				row.append(value)
+			values.append(row)
+
+		frappe.db.bulk_insert(
+			"SF Inventory Data Import Error Logs",
+			fields=["name", "creation", "modified", "owner", "modified_by", "docstatus"] + ERROR_LOG_FIELDS,
+			values=values,
+			chunk_size=ERROR_LOG_INSERT_CHUNK_SIZE
+		)
+
+		if invalid_values:
+			frappe.log_error(
+				title="Invalid SF Inventory Data Import Error Logs values",
+				message="\n".join(invalid_values)
+			)
+	except Exception as e:
+		frappe.log_error(f"Failed to create error logs: {str(e)}")
+
+
+def flush_error_logs():
+	"""
+	Insert the buffered error logs (see insert_error_logs) and stop buffering
+	Committing is left to the caller
+	Returns the number of buffered error logs
+	"""
+	error_logs = getattr(frappe.local, "sf_import_error_logs", None)
+	frappe.local.sf_import_error_logs = None
+	if not error_logs:
+		return 0
+
+	insert_error_logs(error_logs)
+	return len(error_logs)
@@ -1,8 +1,20 @@
 # Copyright (c) 2025, Hopnet Communications LLP and contributors
 # For license information, please see license.txt
 
-# import frappe
+import frappe
 from frappe.model.document import Document
 
+# Cache key of the SKU lookup maps of the order import (see load_sf_product_maps in
+# inv_mgmt.cron_functions.import_sf_order_master)
+SF_PRODUCT_MAPS_CACHE_KEY = "sf_product_maps"
+
 class SFProductMaster(Document):
-	pass
\ No newline at end of file
+	def on_update(self):
+		clear_sf_product_maps_cache()
+
+	def on_trash(self):
+		clear_sf_product_maps_cache()
+
+
+def clear_sf_product_maps_cache():
+	frappe.cache().delete_value(SF_PRODUCT_MAPS_CACHE_KEY)
@@ -0,0 +1,9 @@
+import frappe
+
+
+def execute():
+    """
+    Add a composite index on SF Order Item (parent, is_item_processed) so the
+    order aggregation lookups of unprocessed items for a batch of orders stay fast
+    """
+    frappe.db.add_index("SF Order Item", ["parent", "is_item_processed"], "parent_is_item_processed_index")